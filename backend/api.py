@@ -1,26 +1,67 @@
 import os
-import time
-from collections import deque, defaultdict
-from datetime import datetime
-from fastapi import FastAPI, Form, HTTPException, Header, Depends, Request
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Form, HTTPException, Header, Depends, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 import numpy as np
-import joblib
-import ast
 
-from sentence_transformers import SentenceTransformer
 from openai import OpenAI
 from dotenv import load_dotenv
 
-from config import DATA_DIR, EMBEDDING_MODEL_NAME
+from chunking import Chunk, chunk_text
+from citations import (
+    CitationCache,
+    CitationClient,
+    CitationFiller,
+    cached_citation,
+    citation_key,
+    fallback_citation,
+)
+from cluster_index import ClusterMembership, load_membership, parse_pub_dates
+from config import EMBEDDING_WARMUP
+from embedding_service import EmbeddingBatcher
 from faculty import scrape_faculty
-
-INDEX_PATH = DATA_DIR / "index.pkl"
-
-app = FastAPI(title="Granular Knowledge Map API")
+from index_store import load_index, read_manifest
+from labels import (
+    LabelCache,
+    LabelStore,
+    label_jobs,
+    make_labeler,
+    relabel,
+    stored_labels,
+)
+from query_cache import QueryCache
+from rate_limiter import make_limiter
+from search_filters import SearchFilters, parse_date_param
+from startup import StartupPhases
+from static_payload import StaticPayload, dumps_json, json_response
+from vector_index import QuantizedEmbeddings, VectorIndex, cluster_centroids, top_k
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # The server starts accepting connections as soon as this yields.
+    loaders = [
+        startup.run(_load_index, ("index", "map", "search")),
+        startup.run(_load_model, ("model",)),
+    ]
+    if not LAZY_STARTUP:
+        for thread in loaders:
+            thread.join()
+        if startup.failed():
+            raise RuntimeError(f"Startup failed: {startup.report()['errors']}")
+    yield
+    citation_filler.close()
+    if embedding_batcher is not None:
+        embedding_batcher.close()
+
+
+app = FastAPI(title="Granular Knowledge Map API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -31,6 +72,21 @@ app.add_middleware(
 )
 
 
+def require_ready(*phases: str):
+    """Dependency answering 503 until the given startup phases have finished."""
+
+    def check():
+        waiting = startup.pending(*phases)
+        if waiting is not None:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Still starting up ({waiting} not loaded).",
+                headers={"Retry-After": "5"},
+            )
+
+    return check
+
+
 def require_api_token(x_compass_key: Optional[str] = Header(default=None)):
     if not API_ACCESS_TOKEN:
         return
@@ -38,18 +94,20 @@ def require_api_token(x_compass_key: Optional[str] = Header(default=None)):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
 
-def _rate_limit(request: Request, key: str, limit: int, window: int, message: str):
+def _rate_wait(request: Request, key: str, limit: int, window: int) -> float:
+    """Charge one request to the client's ``key`` limit; seconds to wait, or 0.0."""
     if limit <= 0 or window <= 0:
-        return
+        return 0.0
     host = request.client.host if request.client else "global"
-    bucket_key = f"{key}:{host}"
-    now = time.time()
-    bucket = _rate_buckets[bucket_key]
-    while bucket and now - bucket[0] > window:
-        bucket.popleft()
-    if len(bucket) >= limit:
-        raise HTTPException(status_code=429, detail=message)
-    bucket.append(now)
+    return rate_limiter.hit(f"{key}:{host}", limit, window)
+
+
+def _rate_limit(request: Request, key: str, limit: int, window: int, message: str):
+    wait = _rate_wait(request, key, limit, window)
+    if wait:
+        raise HTTPException(
+            status_code=429, detail=message, headers={"Retry-After": str(int(wait) + 1)}
+        )
 
 
 def rate_limit_faculty(request: Request):
@@ -82,55 +140,6 @@ def rate_limit_citation(request: Request):
     )
 
 
-def _clean_field(value):
-    """Convert NaN / Nones to None, everything else to str."""
-    if value is None:
-        return None
-    try:
-        if isinstance(value, float) and np.isnan(value):
-            return None
-    except Exception:
-        pass
-    return str(value)
-
-
-def _clean_headline(value):
-    """Headline sometimes comes as a dict-like structure from NYT metadata."""
-    # dict case
-    if isinstance(value, dict):
-        main = value.get("main") or value.get("print_headline") or ""
-        return str(main) if main is not None else ""
-
-    # string that looks like a dict with 'main'
-    if isinstance(value, str) and value.strip().startswith("{") and "main" in value:
-        try:
-            parsed = ast.literal_eval(value)
-            if isinstance(parsed, dict):
-                main = parsed.get("main") or parsed.get("print_headline") or ""
-                if main:
-                    return str(main)
-        except Exception:
-            pass
-
-    cleaned = _clean_field(value)
-    return cleaned or ""
-
-
-# ------- load index -------
-
-index = joblib.load(INDEX_PATH)
-articles = index["articles"]
-embeddings = index["embeddings"]
-coords_2d = index["coords_2d"]
-coarse_ids = index["coarse_ids"]
-fine_ids = index["fine_ids"]
-parent_fine_ids = index["parent_fine_ids"]
-coarse_clusters = index["coarse_clusters"]
-fine_clusters = index["fine_clusters"]
-coarse_cluster_labels = index["coarse_cluster_labels"]
-fine_cluster_labels = index["fine_cluster_labels"]
-map_bounds = index["map_bounds"]
-
 load_dotenv()
 API_ACCESS_TOKEN = os.getenv("API_ACCESS_TOKEN")
 FACULTY_RATE_LIMIT = int(os.getenv("FACULTY_RATE_LIMIT", "10"))
@@ -139,67 +148,173 @@ UPLOAD_RATE_LIMIT = int(os.getenv("UPLOAD_RATE_LIMIT", "10"))
 UPLOAD_RATE_WINDOW = int(os.getenv("UPLOAD_RATE_WINDOW", "60"))
 CITATION_RATE_LIMIT = int(os.getenv("CITATION_RATE_LIMIT", "20"))
 CITATION_RATE_WINDOW = int(os.getenv("CITATION_RATE_WINDOW", "60"))
-_rate_buckets = defaultdict(deque)
-embed_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-emb_norm = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+# IVF search: probe this many fine clusters per query (0 = exact scan), and
+# only once the corpus is large enough for the exact scan to be noticeable.
+SEARCH_NPROBE = int(os.getenv("SEARCH_NPROBE", "16"))
+SEARCH_ANN_MIN_ARTICLES = int(os.getenv("SEARCH_ANN_MIN_ARTICLES", "50000"))
+# Score against the index's int8/float16 codes first, then re-rank the best
+# k * SEARCH_RERANK candidates from the memory-mapped float32 embeddings.
+SEARCH_QUANTIZED = os.getenv("SEARCH_QUANTIZED", "0") == "1"
+SEARCH_RERANK = int(os.getenv("SEARCH_RERANK", "4"))
+SEARCH_BATCH_MAX = int(os.getenv("SEARCH_BATCH_MAX", "100"))
+# mode=hybrid: keyword hits scored densely and fused with the dense ranking
+SEARCH_HYBRID_CANDIDATES = int(os.getenv("SEARCH_HYBRID_CANDIDATES", "1000"))
+# /api/upload document mode: texts longer than one chunk are split into
+# overlapping sentence-aligned chunks, embedded in one batch and placed by
+# aggregating per-chunk neighbors (max or mean) and a per-chunk cluster vote.
+UPLOAD_MAX_CHARS = int(os.getenv("UPLOAD_MAX_CHARS", "200000"))
+UPLOAD_CHUNK_WORDS = int(os.getenv("UPLOAD_CHUNK_WORDS", "180"))
+UPLOAD_CHUNK_OVERLAP = int(os.getenv("UPLOAD_CHUNK_OVERLAP", "40"))
+UPLOAD_MAX_CHUNKS = int(os.getenv("UPLOAD_MAX_CHUNKS", "64"))
+UPLOAD_CHUNK_NEIGHBORS = int(os.getenv("UPLOAD_CHUNK_NEIGHBORS", "20"))
+UPLOAD_CHUNK_AGG = os.getenv("UPLOAD_CHUNK_AGG", "max")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_MAX_MB = int(os.getenv("QUERY_CACHE_MAX_MB", "64"))
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "3600"))
+CLUSTER_PAGE_SIZE = int(os.getenv("CLUSTER_PAGE_SIZE", "200"))
+CLUSTER_PAGE_MAX = int(os.getenv("CLUSTER_PAGE_MAX", "1000"))
+MAP_CACHE_MAX_AGE = int(os.getenv("MAP_CACHE_MAX_AGE", "300"))
+# Ask OpenAI for labels missing from data/cluster_labels.json in a background
+# thread after startup; otherwise run `python labels.py` offline.
+RELABEL_ON_STARTUP = os.getenv("RELABEL_ON_STARTUP", "0") == "1"
+# Load the index and the embedding model on background threads after the
+# server binds (set LAZY_STARTUP=0 to finish loading before serving).
+LAZY_STARTUP = os.getenv("LAZY_STARTUP", "1") == "1"
+# "memory" (per worker) or "sqlite:<path>" to share limits across workers.
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+rate_limiter = make_limiter(RATE_LIMIT_BACKEND, max_keys=RATE_LIMIT_MAX_KEYS)
+query_cache = QueryCache(
+    max_entries=QUERY_CACHE_SIZE,
+    max_bytes=QUERY_CACHE_MAX_MB << 20,
+    ttl=QUERY_CACHE_TTL,
+)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
-
-
-def _sample_cluster_texts(mask: np.ndarray, limit: int = 5):
-    idxs = np.where(mask)[0]
-    samples = []
-    for i in idxs:
-        art = articles[i]
-        headline = _clean_headline(art.get("headline"))
-        if headline:
-            samples.append(headline)
-        if len(samples) >= limit:
-            break
-    return samples
-
-
-def _ai_label(default_label: str, samples: List[str], level: str):
-    if not openai_client or not samples:
-        return default_label
-    prompt = (
-        "You rename clusters inside a knowledge map built from New York Times articles.\n"
-        f"Provide a concise {level} label (max 4 words, Title Case) based on these sample headlines:\n"
-        + "\n".join(f"- {s}" for s in samples)
-        + f"\nExisting label: {default_label}\nReturn only the improved label."
+# Citations are cached in data/citations.db. POST /api/citations answers at
+# once and generates at most CITATION_FILL_BUDGET misses per batch on
+# CITATION_FILL_WORKERS threads, each charged to the client's citation rate
+# limit like a /api/citation call; `python citations.py` fills it offline.
+CITATION_BATCH_MAX = int(os.getenv("CITATION_BATCH_MAX", "50"))
+CITATION_FILL_BUDGET = int(os.getenv("CITATION_FILL_BUDGET", "20"))
+CITATION_FILL_WORKERS = int(os.getenv("CITATION_FILL_WORKERS", "4"))
+citation_client = CitationClient(openai_client) if openai_client is not None else None
+citation_cache = CitationCache()
+citation_filler = CitationFiller(citation_cache, citation_client, workers=CITATION_FILL_WORKERS)
+
+# ------- startup state -------
+
+# "index": arrays and metadata; "map": memberships, labels and the serialized
+# map; "search": ANN index and filters; "model": the embedding model. The
+# module globals below stay None until their phase is ready.
+startup = StartupPhases(("index", "map", "search", "model"))
+_READY_MAP = require_ready("index", "map")
+_READY_SEARCH = require_ready("index", "map", "search", "model")
+
+index = index_version = articles = embeddings = coords_2d = None
+coarse_ids = fine_ids = parent_fine_ids = fine_centroids = pub_ts = None
+coarse_clusters = fine_clusters = coarse_cluster_labels = fine_cluster_labels = None
+map_bounds = lexical_index = None
+coarse_members = fine_members = label_store = _label_jobs = _map_payload = None
+vector_index = search_filters = None
+embed_model = embedding_batcher = None
+
+
+def _embed_query(text: str) -> np.ndarray:
+    key = QueryCache.key("vec", text)
+    q_vec = query_cache.get(key)
+    if q_vec is None:
+        q_vec = query_cache.put(key, embedding_batcher.encode([text])[0])
+    return q_vec
+
+
+def _hybrid_search(
+    text: str,
+    k: int,
+    nprobe: Optional[int] = None,
+    rows: Optional[np.ndarray] = None,
+    exact: bool = False,
+):
+    """Fuse keyword and dense rankings with reciprocal rank fusion.
+
+    The keyword postings pick up to SEARCH_HYBRID_CANDIDATES articles and only
+    those are scored densely. Queries with fewer than k keyword hits fall back
+    to the normal dense search for the dense ranking. Scores in the result are
+    the dense cosine similarities, so they read like semantic search scores.
+    """
+    from lexical_index import reciprocal_rank_fusion  # sklearn; keep it off the import path
+
+    q_vec = _embed_query(text)
+    lex_rows, _ = lexical_index.search(text, SEARCH_HYBRID_CANDIDATES, allowed=rows)
+    if len(lex_rows) >= k:
+        dense_rows, _ = vector_index.search_within(q_vec, lex_rows, len(lex_rows), exact=exact)
+    else:
+        dense_rows, _ = vector_index.search(q_vec, k, nprobe=nprobe, rows=rows, exact=exact)
+    fused = reciprocal_rank_fusion([dense_rows, lex_rows], k)
+    return fused, np.asarray(embeddings[fused]) @ q_vec
+
+
+def _search_top_k(
+    text: str,
+    k: int,
+    nprobe: Optional[int] = None,
+    mode: str = "semantic",
+    filters: Optional[tuple] = None,
+    exact: bool = False,
+):
+    """Top-k (indices, scores) for a query, served from the cache when possible.
+
+    ``filters`` are ``SearchFilters.rows`` arguments (date_from, date_to,
+    section, coarse_id, fine_id). ``exact`` scores in float32 without IVF or
+    the quantized first pass.
+    """
+    key = QueryCache.key(
+        "top" if mode == "semantic" else mode, text, k, nprobe, exact, *(filters or ())
     )
-    try:
-        response = openai_client.responses.create(
-            model="gpt-4o-mini",
-            input=prompt,
-        )
-        text = (response.output_text or "").strip()
-        return text if text else default_label
-    except Exception:
-        return default_label
-
+    hit = query_cache.get(key)
+    if hit is None:
+        rows = search_filters.rows(*filters) if filters else None
+        if mode == "lexical":
+            found = lexical_index.search(text, k, allowed=rows)
+        elif mode == "hybrid":
+            found = _hybrid_search(text, k, nprobe=nprobe, rows=rows, exact=exact)
+        else:
+            found = vector_index.search(
+                _embed_query(text), k, nprobe=nprobe, rows=rows, exact=exact
+            )
+        hit = query_cache.put(key, found)
+    return hit
 
-def _apply_ai_labels():
-    if not openai_client:
-        return
-    for cluster in coarse_clusters:
-        cid = cluster["id"]
-        samples = _sample_cluster_texts(coarse_ids == cid)
-        if not samples:
-            continue
-        new_label = _ai_label(cluster["label"], samples, "topic")
-        cluster["label"] = new_label
-        coarse_cluster_labels[cid] = new_label
-    for cluster in fine_clusters:
-        fid = cluster["id"]
-        samples = _sample_cluster_texts(fine_ids == fid)
-        if not samples:
-            continue
-        new_label = _ai_label(cluster["label"], samples, "subtopic")
-        cluster["label"] = new_label
-        fine_cluster_labels[fid] = new_label
 
-_apply_ai_labels()
+def _search_batch(
+    texts: List[str], ks: List[int], nprobe: Optional[int] = None, exact: bool = False
+):
+    """``_search_top_k`` for many queries: cache misses share one encode call
+    and one scan of the corpus."""
+    keys = [QueryCache.key("top", text, k, nprobe, exact) for text, k in zip(texts, ks)]
+    results = [query_cache.get(key) for key in keys]
+    todo = [i for i, hit in enumerate(results) if hit is None]
+    if not todo:
+        return results
+
+    vectors = {i: query_cache.get(QueryCache.key("vec", texts[i])) for i in todo}
+    to_encode = sorted({texts[i] for i in todo if vectors[i] is None})
+    if to_encode:
+        encoded = dict(zip(to_encode, embedding_batcher.encode(to_encode)))
+        for text, vec in encoded.items():
+            query_cache.put(QueryCache.key("vec", text), vec)
+        for i in todo:
+            if vectors[i] is None:
+                vectors[i] = encoded[texts[i]]
+
+    found = vector_index.search_batch(
+        np.stack([vectors[i] for i in todo]), [ks[i] for i in todo], nprobe=nprobe, exact=exact
+    )
+    for i, hit in zip(todo, found):
+        results[i] = query_cache.put(keys[i], hit)
+    return results
 
 
 class MapBounds(BaseModel):
@@ -248,6 +363,19 @@ class FineClusterDetailResponse(BaseModel):
     label: str
     parent_coarse_id: int
     parent_label: str
+    total: int
+    offset: int
+    limit: int
+    articles: List[ArticleSummary]
+
+
+class CoarseClusterDetailResponse(BaseModel):
+    coarse_cluster_id: int
+    label: str
+    fine_cluster_ids: List[int]
+    total: int
+    offset: int
+    limit: int
     articles: List[ArticleSummary]
 
 
@@ -256,6 +384,32 @@ class SearchResults(BaseModel):
     results: List[ArticleSummary]
 
 
+class BatchSearchQuery(BaseModel):
+    q: str
+    k: int = 20
+
+
+class BatchSearchRequest(BaseModel):
+    queries: List[BatchSearchQuery]
+    nprobe: Optional[int] = None
+    exact: bool = False
+
+
+class BatchSearchResults(BaseModel):
+    results: List[SearchResults]
+
+
+class ChunkAttribution(BaseModel):
+    index: int
+    start: int
+    end: int
+    preview: str
+    fine_cluster_id: int
+    fine_cluster_label: str
+    top_article_id: Optional[int] = None
+    score: Optional[float] = None
+
+
 class UploadResult(BaseModel):
     text: str
     fine_cluster_id: int
@@ -263,6 +417,9 @@ class UploadResult(BaseModel):
     parent_coarse_id: int
     parent_coarse_label: str
     neighbors: List[ArticleSummary]
+    mode: str = "single"
+    truncated: bool = False
+    chunks: Optional[List[ChunkAttribution]] = None
 
 
 class CitationRequest(BaseModel):
@@ -277,6 +434,22 @@ class CitationRequest(BaseModel):
 class CitationResponse(BaseModel):
     citation: str
 
+
+class CitationBatchRequest(BaseModel):
+    items: List[CitationRequest]
+
+
+class CitationResult(BaseModel):
+    citation: str
+    # cached: the model's citation; pending: fallback now, model citation
+    # being generated for next time; fallback: fallback only.
+    status: Literal["cached", "pending", "fallback"]
+
+
+class CitationBatchResponse(BaseModel):
+    citations: List[CitationResult]
+
+
 class FacultyMember(BaseModel):
     name: str
     department: Optional[str] = None
@@ -284,23 +457,203 @@ class FacultyMember(BaseModel):
     keyword: Optional[str] = None
 
 
-@app.get("/api/map", response_model=MapResponse)
-def get_map(_: None = Depends(require_api_token)):
-    return MapResponse(
+def _build_map_payload(coarse: List[dict], fine: List[dict]) -> StaticPayload:
+    """Serialize the map once; it only changes when cluster labels do."""
+    body = MapResponse(
         bounds=MapBounds(**map_bounds),
-        coarse_clusters=[CoarseMapNode(**c) for c in coarse_clusters],
-        fine_clusters=[FineMapNode(**f) for f in fine_clusters],
+        coarse_clusters=[CoarseMapNode(**c) for c in coarse],
+        fine_clusters=[FineMapNode(**f) for f in fine],
+    )
+    raw = dumps_json(jsonable_encoder(body))
+    return StaticPayload(raw, f"private, max-age={MAP_CACHE_MAX_AGE}")
+
+
+def _apply_labels(labels: dict):
+    """Swap in {(level, cid): label} overrides together with a re-serialized map."""
+    global coarse_clusters, fine_clusters, coarse_cluster_labels, fine_cluster_labels
+    global _map_payload
+    with _label_lock:
+        coarse = [dict(c, label=labels.get(("coarse", c["id"]), c["label"])) for c in coarse_clusters]
+        fine = [dict(f, label=labels.get(("fine", f["id"]), f["label"])) for f in fine_clusters]
+        payload = _build_map_payload(coarse, fine)
+        coarse_cluster_labels = {**coarse_cluster_labels, **{c["id"]: c["label"] for c in coarse}}
+        fine_cluster_labels = {**fine_cluster_labels, **{f["id"]: f["label"] for f in fine}}
+        coarse_clusters, fine_clusters, _map_payload = coarse, fine, payload
+
+
+def _relabel_in_background(labeler):
+    stats = relabel(label_store, labeler, _label_jobs, cache=LabelCache())
+    if stats["requested"] or stats["cached"]:
+        _apply_labels(stored_labels(label_store, _label_jobs))
+
+
+_label_lock = threading.Lock()
+
+
+def _load_index():
+    """Index, then map, then search structures; each phase unlocks endpoints."""
+    global index, index_version, articles, embeddings, coords_2d, coarse_ids, fine_ids
+    global parent_fine_ids, coarse_clusters, fine_clusters, coarse_cluster_labels
+    global fine_cluster_labels, map_bounds, fine_centroids, pub_ts, lexical_index
+    global coarse_members, fine_members, label_store, _label_jobs
+    global vector_index, search_filters
+
+    with startup.phase("index"):
+        # Arrays are memory-mapped, so worker processes share one page-cached copy.
+        loaded = load_index()
+        articles = loaded["articles"]
+        embeddings = loaded["embeddings"]
+        coords_2d = loaded["coords_2d"]
+        coarse_ids = loaded["coarse_ids"]
+        fine_ids = loaded["fine_ids"]
+        parent_fine_ids = loaded["parent_fine_ids"]
+        coarse_clusters = loaded["coarse_clusters"]
+        fine_clusters = loaded["fine_clusters"]
+        coarse_cluster_labels = loaded["coarse_cluster_labels"]
+        fine_cluster_labels = loaded["fine_cluster_labels"]
+        map_bounds = loaded["map_bounds"]
+        lexical_index = loaded.get("lexical")
+        centroids = loaded.get("fine_centroids")
+        if centroids is None:
+            centroids = cluster_centroids(embeddings, fine_ids, parent_fine_ids.shape[0])
+        fine_centroids = centroids
+        index_version = loaded["version"]
+        query_cache.set_version(index_version)
+        index = loaded
+
+    with startup.phase("map"):
+        coarse_members = load_membership(index, "coarse")
+        fine_members = load_membership(index, "fine", fine_centroids)
+        label_store = LabelStore()
+        _label_jobs = label_jobs(
+            articles, coarse_clusters, fine_clusters, coarse_members, fine_members
+        )
+        _apply_labels(stored_labels(label_store, _label_jobs))
+        labeler = make_labeler(openai_client)
+    if RELABEL_ON_STARTUP and labeler is not None:
+        threading.Thread(
+            target=_relabel_in_background, args=(labeler,), name="relabel", daemon=True
+        ).start()
+
+    with startup.phase("search"):
+        dates = index.get("pub_ts")
+        if dates is None:
+            dates = parse_pub_dates(articles[i].get("pub_date") for i in range(len(articles)))
+        pub_ts = dates
+        search_filters = SearchFilters.from_index(index, articles, pub_ts)
+        vector_index = VectorIndex(
+            embeddings,
+            fine_ids,
+            fine_centroids,
+            nprobe=SEARCH_NPROBE,
+            min_size=SEARCH_ANN_MIN_ARTICLES,
+            quantized=(
+                QuantizedEmbeddings(index["embedding_codes"], index["embedding_scales"])
+                if SEARCH_QUANTIZED and index.get("embedding_codes") is not None
+                else None
+            ),
+            rerank=SEARCH_RERANK,
+        )
+
+
+def _load_model():
+    global embed_model, embedding_batcher
+
+    with startup.phase("model"):
+        # Imported here so torch loads on this thread, not before the server binds.
+        from embedding_model import load_embedding_model, model_fingerprint
+
+        embed_model = load_embedding_model(warmup=EMBEDDING_WARMUP)
+        indexed = (read_manifest() or {}).get("embedding_fingerprint")
+        if indexed is not None and indexed != model_fingerprint():
+            print(
+                f"[startup] WARNING: the index was embedded as {indexed} but queries "
+                f"use {model_fingerprint()}; search results will be off until the "
+                "index is rebuilt or EMBEDDING_BACKEND is switched back."
+            )
+        embedding_batcher = EmbeddingBatcher(
+            embed_model, max_batch_size=EMBED_BATCH_SIZE, max_wait_ms=EMBED_BATCH_WAIT_MS
+        )
+
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up. 500 only if a startup phase failed."""
+    if startup.failed():
+        return JSONResponse(startup.report(), status_code=500)
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: 200 once search is usable, 503 with per-phase status until then."""
+    report = startup.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+
+@app.get("/api/map", response_model=MapResponse)
+def get_map(
+    request: Request,
+    _: None = Depends(require_api_token),
+    __: None = Depends(_READY_MAP),
+):
+    return _map_payload.response(request)
+
+
+ClusterSort = Literal["centroid_distance", "date"]
+
+
+def _summaries(rows: np.ndarray, scores: Optional[np.ndarray] = None) -> List[dict]:
+    """ArticleSummary-shaped dicts built column-wise, skipping per-row validation."""
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = articles.take(rows)
+    xs, ys = np.asarray(coords_2d[rows], dtype=np.float64).T.tolist() if rows.size else ([], [])
+    coarse = coarse_ids[rows].tolist()
+    fine = fine_ids[rows].tolist()
+    score_list = (
+        np.asarray(scores, dtype=np.float64).tolist() if scores is not None else [None] * rows.size
     )
+    return [
+        {
+            "id": cols["id"][j],
+            "headline": cols["headline"][j] or "",
+            "abstract": cols["abstract"][j],
+            "pub_date": cols["pub_date"][j],
+            "section": cols["section"][j],
+            "byline": cols["byline"][j],
+            "url": cols["url"][j],
+            "coarse_cluster_id": coarse[j],
+            "fine_cluster_id": fine[j],
+            "x": xs[j],
+            "y": ys[j],
+            "score": score_list[j],
+        }
+        for j in range(rows.size)
+    ]
+
+
+def _cluster_page(
+    members: ClusterMembership, cid: int, offset: int, limit: int, sort: ClusterSort
+) -> List[dict]:
+    # Stored order is already "most central first"; dates are ranked per request.
+    sort_keys = pub_ts if sort == "date" else None
+    return _summaries(members.page(cid, offset, limit, sort_keys))
 
 
 @app.get("/api/fine_cluster/{fine_id}", response_model=FineClusterDetailResponse)
-def get_fine_cluster(fine_id: int, _: None = Depends(require_api_token)):
+def get_fine_cluster(
+    fine_id: int,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(CLUSTER_PAGE_SIZE, ge=1, le=CLUSTER_PAGE_MAX),
+    sort: ClusterSort = "centroid_distance",
+    _: None = Depends(require_api_token),
+    __: None = Depends(_READY_MAP),
+):
     if fine_id < 0 or fine_id >= parent_fine_ids.shape[0]:
         raise HTTPException(status_code=404, detail="Fine cluster not found")
 
-    mask = fine_ids == fine_id
-    idxs = np.where(mask)[0]
-    if idxs.size == 0:
+    total = fine_members.count(fine_id)
+    if total == 0:
         raise HTTPException(status_code=404, detail="Fine cluster not found")
 
     parent_id = int(parent_fine_ids[fine_id])
@@ -311,79 +664,180 @@ def get_fine_cluster(fine_id: int, _: None = Depends(require_api_token)):
     )
     label = fine_cluster_labels.get(fine_id, f"Subtopic {fine_id}")
 
-    articles_out = []
-    for i in idxs:
-        art = articles[i]
-        x, y = coords_2d[i]
-        articles_out.append(
-            ArticleSummary(
-                id=int(art["id"]),
-                headline=_clean_headline(art.get("headline")),
-                abstract=_clean_field(art.get("abstract")),
-                pub_date=_clean_field(art.get("pub_date")),
-                section=_clean_field(art.get("section")),
-                byline=_clean_field(art.get("byline")),
-                url=_clean_field(art.get("url")),
-                coarse_cluster_id=int(coarse_ids[i]),
-                fine_cluster_id=int(fine_ids[i]),
-                x=float(x),
-                y=float(y),
-            )
-        )
+    return json_response(
+        {
+            "fine_cluster_id": int(fine_id),
+            "label": label,
+            "parent_coarse_id": parent_id,
+            "parent_label": parent_label,
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "articles": _cluster_page(fine_members, fine_id, offset, limit, sort),
+        }
+    )
 
-    return FineClusterDetailResponse(
-        fine_cluster_id=int(fine_id),
-        label=label,
-        parent_coarse_id=parent_id,
-        parent_label=parent_label,
-        articles=articles_out,
+
+@app.get("/api/coarse_cluster/{coarse_id}", response_model=CoarseClusterDetailResponse)
+def get_coarse_cluster(
+    coarse_id: int,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(CLUSTER_PAGE_SIZE, ge=1, le=CLUSTER_PAGE_MAX),
+    sort: ClusterSort = "centroid_distance",
+    _: None = Depends(require_api_token),
+    __: None = Depends(_READY_MAP),
+):
+    if coarse_id < 0 or coarse_id >= len(coarse_members):
+        raise HTTPException(status_code=404, detail="Coarse cluster not found")
+
+    total = coarse_members.count(coarse_id)
+    if total == 0:
+        raise HTTPException(status_code=404, detail="Coarse cluster not found")
+
+    return json_response(
+        {
+            "coarse_cluster_id": int(coarse_id),
+            "label": coarse_cluster_labels.get(coarse_id, f"Topic {coarse_id}"),
+            "fine_cluster_ids": np.flatnonzero(parent_fine_ids == coarse_id).tolist(),
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "articles": _cluster_page(coarse_members, coarse_id, offset, limit, sort),
+        }
     )
 
 
 @app.get("/api/search", response_model=SearchResults)
-def search_articles(q: str, k: int = 20, _: None = Depends(require_api_token)):
-    q_vec = embed_model.encode([q], normalize_embeddings=True)[0]
-    sims = emb_norm @ q_vec
-    top_idx = np.argsort(-sims)[:k]
+def search_articles(
+    q: str,
+    k: int = 20,
+    nprobe: Optional[int] = None,
+    exact: bool = False,
+    mode: Literal["semantic", "lexical", "hybrid"] = "semantic",
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    section: Optional[str] = None,
+    coarse_id: Optional[int] = None,
+    fine_id: Optional[int] = None,
+    _: None = Depends(require_api_token),
+    __: None = Depends(_READY_SEARCH),
+):
+    if mode != "semantic" and lexical_index is None:
+        raise HTTPException(
+            status_code=422,
+            detail="This index has no keyword postings; rebuild it to use lexical search.",
+        )
+    try:
+        ts_from = parse_date_param(date_from) if date_from else None
+        ts_to = parse_date_param(date_to, end=True) if date_to else None
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    filters = (ts_from, ts_to, section, coarse_id, fine_id)
+    top_idx, top_scores = _search_top_k(
+        q,
+        k,
+        nprobe=nprobe,
+        mode=mode,
+        filters=filters if any(f is not None for f in filters) else None,
+        exact=exact,
+    )
 
-    results = []
-    for i in top_idx:
-        s = float(sims[i])
-        art = articles[i]
-        x, y = coords_2d[i]
-        results.append(
-            ArticleSummary(
-                id=int(art["id"]),
-                headline=_clean_headline(art.get("headline")),
-                abstract=_clean_field(art.get("abstract")),
-                pub_date=_clean_field(art.get("pub_date")),
-                section=_clean_field(art.get("section")),
-                byline=_clean_field(art.get("byline")),
-                url=_clean_field(art.get("url")),
-                coarse_cluster_id=int(coarse_ids[i]),
-                fine_cluster_id=int(fine_ids[i]),
-                x=float(x),
-                y=float(y),
-                score=s,
-            )
+    return json_response({"query": q, "results": _summaries(top_idx, top_scores)})
+
+
+@app.post("/api/search/batch", response_model=BatchSearchResults)
+def search_articles_batch(
+    req: BatchSearchRequest,
+    _: None = Depends(require_api_token),
+    __: None = Depends(_READY_SEARCH),
+):
+    if len(req.queries) > SEARCH_BATCH_MAX:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {SEARCH_BATCH_MAX} queries per batch.",
         )
+    texts = [item.q for item in req.queries]
+    ks = [max(item.k, 0) for item in req.queries]
+    found = _search_batch(texts, ks, nprobe=req.nprobe, exact=req.exact)
+
+    return json_response(
+        {
+            "results": [
+                {"query": text, "results": _summaries(idx, scores)}
+                for text, (idx, scores) in zip(texts, found)
+            ]
+        }
+    )
+
 
-    return SearchResults(query=q, results=results)
+def _majority_fine(neighbor_lists: List[np.ndarray]) -> np.ndarray:
+    """Most common fine cluster among each list's articles (ties: lowest id)."""
+    n_fine = parent_fine_ids.shape[0]
+    owners = np.repeat(np.arange(len(neighbor_lists)), [len(n) for n in neighbor_lists])
+    flat = fine_ids[np.concatenate(neighbor_lists)].astype(np.int64)
+    votes = np.bincount(owners * n_fine + flat, minlength=len(neighbor_lists) * n_fine)
+    return votes.reshape(len(neighbor_lists), n_fine).argmax(axis=1)
+
+
+def _place_document(chunks: List[Chunk], k: int = 10):
+    """Neighbors, fine cluster and per-chunk attribution for a chunked document."""
+    vectors = embedding_batcher.encode([chunk.text for chunk in chunks])
+    per_chunk = vector_index.search_batch(vectors, [UPLOAD_CHUNK_NEIGHBORS] * len(chunks))
+    candidates = np.unique(np.concatenate([idx for idx, _ in per_chunk]))
+    sims = np.asarray(embeddings[candidates]) @ vectors.T  # (candidates, chunks)
+    scores = sims.mean(axis=1) if UPLOAD_CHUNK_AGG == "mean" else sims.max(axis=1)
+    best = top_k(scores, k)
+    top_idx, top_scores = candidates[best], scores[best]
+
+    chunk_fine = _majority_fine([idx[:10] for idx, _ in per_chunk])
+    n_fine = parent_fine_ids.shape[0]
+    # Chunks vote; the document-level neighbors only break ties.
+    votes = np.bincount(chunk_fine, minlength=n_fine) + 1e-3 * np.bincount(
+        fine_ids[top_idx], minlength=n_fine
+    )
+    attribution = [
+        {
+            "index": i,
+            "start": chunk.start,
+            "end": chunk.end,
+            "preview": chunk.text[:160],
+            "fine_cluster_id": int(fid),
+            "fine_cluster_label": fine_cluster_labels.get(int(fid), f"Subtopic {fid}"),
+            "top_article_id": int(articles.ids[idx[0]]) if len(idx) else None,
+            "score": float(sc[0]) if len(sc) else None,
+        }
+        for i, (chunk, fid, (idx, sc)) in enumerate(zip(chunks, chunk_fine, per_chunk))
+    ]
+    return top_idx, top_scores, int(votes.argmax()), attribution
 
 
 @app.post("/api/upload", response_model=UploadResult)
-async def upload_text(
+def upload_text(
     text: str = Form(...),
+    mode: Literal["auto", "single", "document"] = Form("auto"),
     _: None = Depends(require_api_token),
-    __: None = Depends(rate_limit_upload),
+    __: None = Depends(_READY_SEARCH),
+    ___: None = Depends(rate_limit_upload),
 ):
-    q_vec = embed_model.encode([text], normalize_embeddings=True)[0]
-    sims = emb_norm @ q_vec
-    top_idx = np.argsort(-sims)[:10]
+    truncated = len(text) > UPLOAD_MAX_CHARS
+    body = text[:UPLOAD_MAX_CHARS]
+    chunks = None
+    if mode != "single":
+        chunks = chunk_text(
+            body,
+            max_words=UPLOAD_CHUNK_WORDS,
+            overlap_words=UPLOAD_CHUNK_OVERLAP,
+            max_chunks=UPLOAD_MAX_CHUNKS,
+        )
+        if not chunks or (mode == "auto" and len(chunks) == 1):
+            chunks = None
 
-    neighbor_fine_clusters = fine_ids[top_idx]
-    unique, counts = np.unique(neighbor_fine_clusters, return_counts=True)
-    best_fine_cluster = int(unique[np.argmax(counts)])
+    attribution = None
+    if chunks is None:
+        top_idx, top_scores = _search_top_k(body, 10)
+        best_fine_cluster = int(_majority_fine([top_idx])[0])
+    else:
+        top_idx, top_scores, best_fine_cluster, attribution = _place_document(chunks)
 
     parent_id = int(parent_fine_ids[best_fine_cluster])
     fine_label = fine_cluster_labels.get(
@@ -395,146 +849,77 @@ async def upload_text(
         else "Unassigned"
     )
 
-    neighbors = []
-    for i in top_idx:
-        s = float(sims[i])
-        art = articles[i]
-        x, y = coords_2d[i]
-        neighbors.append(
-            ArticleSummary(
-                id=int(art["id"]),
-                headline=_clean_headline(art.get("headline")),
-                abstract=_clean_field(art.get("abstract")),
-                pub_date=_clean_field(art.get("pub_date")),
-                section=_clean_field(art.get("section")),
-                byline=_clean_field(art.get("byline")),
-                url=_clean_field(art.get("url")),
-                coarse_cluster_id=int(coarse_ids[i]),
-                fine_cluster_id=int(fine_ids[i]),
-                x=float(x),
-                y=float(y),
-                score=s,
-            )
-        )
-
-    return UploadResult(
-        text=text,
-        fine_cluster_id=best_fine_cluster,
-        fine_cluster_label=fine_label,
-        parent_coarse_id=parent_id,
-        parent_coarse_label=parent_label,
-        neighbors=neighbors,
+    return json_response(
+        {
+            "text": text,
+            "fine_cluster_id": best_fine_cluster,
+            "fine_cluster_label": fine_label,
+            "parent_coarse_id": parent_id,
+            "parent_coarse_label": parent_label,
+            "neighbors": _summaries(top_idx, top_scores),
+            "mode": "single" if chunks is None else "document",
+            "truncated": truncated,
+            "chunks": attribution,
+        }
     )
 
 
-MONTH_NAMES = [
-    "January",
-    "February",
-    "March",
-    "April",
-    "May",
-    "June",
-    "July",
-    "August",
-    "September",
-    "October",
-    "November",
-    "December",
-]
-
-
-def _format_author(name: str) -> str:
-    if not name:
-        return ""
-    parts = name.strip().replace("By ", "").replace("by ", "").split()
-    if len(parts) == 1:
-        return parts[0].rstrip(",")
-    last = parts[-1].rstrip(",")
-    initials = [p[0].upper() + "." for p in parts[:-1] if p]
-    return f"{last}, {' '.join(initials)}"
-
-
-def _format_author_list(authors: List[str]) -> Optional[str]:
-    formatted = [fmt for fmt in (_format_author(a) for a in authors) if fmt]
-    if not formatted:
-        return None
-    if len(formatted) == 1:
-        return formatted[0]
-    if len(formatted) == 2:
-        return " & ".join(formatted)
-    return ", ".join(formatted[:-1]) + f", & {formatted[-1]}"
-
-
-def _format_date(date_str: Optional[str]) -> str:
-    if not date_str:
-        return "n.d."
-    try:
-        clean = date_str.replace("Z", "+00:00")
-        dt = datetime.fromisoformat(clean)
-        month = MONTH_NAMES[dt.month - 1]
-        day = dt.day
-        return f"{dt.year}, {month} {day}"
-    except Exception:
-        return date_str
-
-
-def _clean_title(title: Optional[str]) -> str:
-    if not title:
-        return "Untitled article"
-    title = title.strip()
-    return title[:-1] if title.endswith(".") else title
-
-
-def _fallback_citation(req: CitationRequest) -> str:
-    author_text = _format_author_list(req.authors or [])
-    date_text = _format_date(req.pub_date)
-    title = _clean_title(req.headline)
-    source = req.source or "The New York Times"
-    url = req.url or ""
-    if author_text:
-        citation = f"{author_text} ({date_text}). {title}. {source}. {url}".strip()
-    else:
-        citation = f"{title}. ({date_text}). {source}. {url}".strip()
-    return citation
-
-
-def _generate_citation(req: CitationRequest) -> str:
-    fallback = _fallback_citation(req)
-    if not openai_client:
-        return fallback
-    prompt = (
-        "Format the following metadata as an APA 7 reference for a news article.\n"
-        "Use the pattern: Author, A. A., & Author, B. B. (Year, Month Day). Title of article. Source. URL\n"
-        "If no author is available, start with the title. Keep capitalization per APA rules. "
-        "Return only the citation line.\n"
-        f"Headline: {req.headline}\n"
-        f"Authors: {', '.join(req.authors or [])}\n"
-        f"Publication date: {req.pub_date}\n"
-        f"Section: {req.section}\n"
-        f"Source: {req.source}\n"
-        f"URL: {req.url}"
-    )
-    try:
-        response = openai_client.responses.create(
-            model="gpt-4o-mini",
-            input=prompt,
-        )
-        text = (response.output_text or "").strip()
-        return text or fallback
-    except Exception:
-        return fallback
-
-
 @app.post("/api/citation", response_model=CitationResponse)
 def create_citation(
     req: CitationRequest,
     _: None = Depends(require_api_token),
     __: None = Depends(rate_limit_citation),
 ):
-    citation = _generate_citation(req)
+    citation = cached_citation(citation_cache, citation_client, dict(req))
     return CitationResponse(citation=citation)
 
 
+@app.post("/api/citations", response_model=CitationBatchResponse)
+def create_citations(
+    req: CitationBatchRequest,
+    request: Request,
+    _: None = Depends(require_api_token),
+    __: None = Depends(rate_limit_citation),
+):
+    """Cached citations at once; misses get the fallback now and are generated
+    in the background (up to CITATION_FILL_BUDGET per batch, and only while the
+    client's citation rate limit allows) for next time."""
+    if len(req.items) > CITATION_BATCH_MAX:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {CITATION_BATCH_MAX} citations per batch.",
+        )
+    fields = [dict(item) for item in req.items]
+    keys = [citation_key(f) for f in fields]
+    hits = citation_cache.get_many(keys)
+    budget = CITATION_FILL_BUDGET if citation_client is not None else 0
+    results = []
+    queued_keys = set()
+    for key, item in zip(keys, fields):
+        if key in hits:
+            results.append({"citation": hits[key], "status": "cached"})
+            continue
+        queued = key in queued_keys
+        if not queued and budget > 0:
+            # Each generation costs the client one citation request.
+            if _rate_wait(request, "citation", CITATION_RATE_LIMIT, CITATION_RATE_WINDOW):
+                budget = 0
+            else:
+                queued = citation_filler.submit(key, item)
+                budget -= 1
+            if queued:
+                queued_keys.add(key)
+        results.append(
+            {"citation": fallback_citation(item), "status": "pending" if queued else "fallback"}
+        )
+    return json_response({"citations": results})
+
+
+@app.get("/api/cache_stats")
+def get_cache_stats(_: None = Depends(require_api_token)):
+    return query_cache.stats()
+
+
 @app.get("/api/faculty", response_model=List[FacultyMember])
 def get_faculty(
     q: str,
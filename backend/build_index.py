@@ -1,22 +1,28 @@
 import numpy as np
-import joblib
 import os
 
-from sentence_transformers import SentenceTransformer
-from sklearn.cluster import MiniBatchKMeans
-from sklearn.manifold import TSNE
+from scipy import sparse
+
 from sklearn.feature_extraction.text import TfidfVectorizer
 from openai import OpenAI
 from dotenv import load_dotenv
 
 from config import (
-    DATA_DIR,
     EMBEDDING_MODEL_NAME,
-    TSNE_PERPLEXITY,
     COARSE_CLUSTER_COUNT,
     FINE_CLUSTER_COUNT,
+    LEXICAL_MAX_FEATURES,
 )
+from clustering import fit_clusters
 from data_prep import load_sample
+from embedding_cache import EmbeddingCache
+from embedding_model import load_embedding_model, model_fingerprint
+from cluster_index import ClusterMembership, membership_order
+from index_store import ArticleTable, write_index
+from layout import compute_layout
+from lexical_index import LexicalIndex
+from labels import LabelCache, label_clusters, label_jobs, make_labeler
+from vector_index import normalize_rows
 
 LABEL_BLOCKLIST = {
     "kicker",
@@ -58,70 +64,104 @@ def _clean_terms(scores, feature_names, default_label):
     return " / ".join(terms)
 
 
+def cluster_indicator(assignments, count):
+    """Sparse (count x articles) 0/1 matrix; row ``cid`` marks the members of ``cid``."""
+    n = len(assignments)
+    return sparse.csr_matrix(
+        (np.ones(n, dtype=np.float64), (np.asarray(assignments), np.arange(n))),
+        shape=(count, n),
+    )
+
+
 def _build_labels(assignments, tfidf_matrix, feature_names, count, prefix):
+    counts = np.bincount(assignments, minlength=count)
+    # One sparse matmul gives every cluster's summed TF-IDF row.
+    sums = (cluster_indicator(assignments, count) @ tfidf_matrix).tocsr()
     labels = {}
     for cid in range(count):
-        mask = assignments == cid
         default_label = f"{prefix} {cid}"
-        if not np.any(mask):
+        if not counts[cid]:
             labels[cid] = default_label
             continue
-        cluster_scores = tfidf_matrix[mask].mean(axis=0).A1
+        cluster_scores = sums[cid].toarray().ravel() / counts[cid]
         labels[cid] = _clean_terms(cluster_scores, feature_names, default_label)
     return labels
 
 
-def _sample_cluster_text(df, mask, limit=5):
-    try:
-        headlines = (
-            df.loc[mask, "headline"]
-            .dropna()
-            .astype(str)
-            .str.strip()
-            .replace("", np.nan)
-            .dropna()
-            .tolist()
+def summarize_clusters(
+    coords_array,
+    coarse_ids,
+    fine_ids,
+    coarse_labels,
+    fine_labels,
+    coarse_count,
+    fine_count,
+    parent_fine_ids=None,
+):
+    """Map bubbles for every non-empty cluster, fine -> coarse parents and map bounds.
+
+    Pass ``parent_fine_ids`` when the clustering is nested; otherwise each fine
+    cluster's parent is the coarse cluster most of its members belong to.
+    """
+    x_min, y_min = coords_array.min(axis=0)
+    x_max, y_max = coords_array.max(axis=0)
+    map_bounds = {
+        "x_min": float(x_min),
+        "x_max": float(x_max),
+        "y_min": float(y_min),
+        "y_max": float(y_max),
+    }
+
+    def centers(assignments, count):
+        sizes = np.bincount(assignments, minlength=count)
+        x = np.bincount(assignments, weights=coords_array[:, 0], minlength=count)
+        y = np.bincount(assignments, weights=coords_array[:, 1], minlength=count)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sizes, x / sizes, y / sizes
+
+    coarse_sizes, coarse_x, coarse_y = centers(coarse_ids, coarse_count)
+    coarse_clusters = []
+    for cid in np.flatnonzero(coarse_sizes):
+        count = int(coarse_sizes[cid])
+        size = 10 + np.log1p(count) * 6
+        coarse_clusters.append(
+            {
+                "id": int(cid),
+                "label": coarse_labels.get(cid, f"Topic {cid}"),
+                "x": float(coarse_x[cid]),
+                "y": float(coarse_y[cid]),
+                "size": float(size),
+                "count": count,
+            }
         )
-    except Exception:
-        headlines = []
-    if not headlines:
-        try:
-            abstracts = (
-                df.loc[mask, "abstract"]
-                .dropna()
-                .astype(str)
-                .str.strip()
-                .replace("", np.nan)
-                .dropna()
-                .tolist()
-            )
-        except Exception:
-            abstracts = []
-        headlines = abstracts
-    return headlines[:limit]
-
-
-def _ai_label(default_label, samples, level):
-    if not openai_client or not samples:
-        return default_label
-    prompt = (
-        f"You are naming clusters inside a knowledge graph of New York Times articles.\n"
-        f"Provide a concise {level} label (max 4 words) based on the following sample headlines:\n"
-        + "\n".join(f"- {s}" for s in samples)
-        + "\nCurrent label suggestion: "
-        f"{default_label}\nRespond with only the improved label."
-    )
-    try:
-        response = openai_client.responses.create(
-            model="gpt-4o-mini",
-            input=prompt,
+
+    fine_sizes, fine_x, fine_y = centers(fine_ids, fine_count)
+    if parent_fine_ids is not None:
+        parents = np.asarray(parent_fine_ids, dtype=np.int32).copy()
+    else:
+        # Majority vote from a (fine x coarse) contingency table; ties go to the
+        # lower coarse id.
+        pairs = np.asarray(fine_ids, dtype=np.int64) * coarse_count + coarse_ids
+        votes = np.bincount(pairs, minlength=fine_count * coarse_count)
+        parents = votes.reshape(fine_count, coarse_count).argmax(axis=1).astype(np.int32)
+    parents[fine_sizes == 0] = -1
+    fine_clusters = []
+    for fid in np.flatnonzero(fine_sizes):
+        count = int(fine_sizes[fid])
+        size = 6 + np.log1p(count) * 4
+        fine_clusters.append(
+            {
+                "id": int(fid),
+                "label": fine_labels.get(fid, f"Subtopic {fid}"),
+                "parent_id": int(parents[fid]),
+                "x": float(fine_x[fid]),
+                "y": float(fine_y[fid]),
+                "size": float(size),
+                "count": count,
+            }
         )
-        text = (response.output_text or "").strip()
-        if not text:
-            return default_label
-        return text[:80]
-    except Exception:
-        return default_label
+
+    return coarse_clusters, fine_clusters, parents, map_bounds
 
 
 def build_index():
@@ -130,35 +170,19 @@ def build_index():
     texts = df["text"].tolist()
 
     print(f"Embedding {len(texts)} articles...")
-    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-    embeddings = model.encode(texts, show_progress_bar=True, normalize_embeddings=True)
+    model = load_embedding_model()
+    embeddings = EmbeddingCache(model_fingerprint()).encode(
+        model, texts, show_progress_bar=True, normalize_embeddings=True
+    )
 
     print("Clustering articles into coarse and fine topics...")
-    coarse_kmeans = MiniBatchKMeans(
-        n_clusters=COARSE_CLUSTER_COUNT,
-        random_state=42,
-        batch_size=512,
-        n_init=10,
+    coarse_ids, coarse_centroids, fine_ids, fine_centroids, fine_parents = fit_clusters(
+        embeddings, COARSE_CLUSTER_COUNT, FINE_CLUSTER_COUNT
     )
-    coarse_ids = coarse_kmeans.fit_predict(embeddings)
+    fine_count = len(fine_centroids)
 
-    fine_kmeans = MiniBatchKMeans(
-        n_clusters=FINE_CLUSTER_COUNT,
-        random_state=123,
-        batch_size=512,
-        n_init=10,
-    )
-    fine_ids = fine_kmeans.fit_predict(embeddings)
-
-    print("Computing 2D layout with t-SNE (for map positions)...")
-    tsne = TSNE(
-        n_components=2,
-        perplexity=min(TSNE_PERPLEXITY, len(texts) - 1),
-        random_state=42,
-        init="random",
-        learning_rate="auto",
-    )
-    coords_2d = tsne.fit_transform(embeddings)
+    print("Computing 2D layout (for map positions)...")
+    coords_2d, _ = compute_layout(embeddings, fine_ids)
 
     print("Computing cluster labels from TF-IDF...")
     vectorizer = TfidfVectorizer(
@@ -171,101 +195,77 @@ def build_index():
         coarse_ids, X_tfidf, feature_names, COARSE_CLUSTER_COUNT, "Topic"
     )
     fine_labels = _build_labels(
-        fine_ids, X_tfidf, feature_names, FINE_CLUSTER_COUNT, "Subtopic"
+        fine_ids, X_tfidf, feature_names, fine_count, "Subtopic"
     )
 
-    if openai_client:
-        print("Refining cluster names with OpenAI...")
-        for cid in range(COARSE_CLUSTER_COUNT):
-            mask = coarse_ids == cid
-            if not np.any(mask):
-                continue
-            samples = _sample_cluster_text(df, mask)
-            coarse_labels[cid] = _ai_label(
-                coarse_labels.get(cid, f"Topic {cid}"), samples, "broad topic"
-            )
-        for fid in range(FINE_CLUSTER_COUNT):
-            mask = fine_ids == fid
-            if not np.any(mask):
-                continue
-            samples = _sample_cluster_text(df, mask)
-            fine_labels[fid] = _ai_label(
-                fine_labels.get(fid, f"Subtopic {fid}"), samples, "subtopic"
-            )
+    print("Building keyword search postings...")
+    search_vectorizer = TfidfVectorizer(
+        max_features=LEXICAL_MAX_FEATURES, ngram_range=(1, 2), stop_words="english"
+    )
+    lexical = LexicalIndex.from_vectorizer(
+        search_vectorizer, search_vectorizer.fit_transform(df["text"])
+    )
 
-    print("Summarizing clusters for the map...")
-    coords_array = np.asarray(coords_2d)
-    x_min, y_min = coords_array.min(axis=0)
-    x_max, y_max = coords_array.max(axis=0)
-    map_bounds = {
-        "x_min": float(x_min),
-        "x_max": float(x_max),
-        "y_min": float(y_min),
-        "y_max": float(y_max),
-    }
+    # Membership in the order the index stores it (most central first), so
+    # label samples here match the ones the API and labels.py derive.
+    norm_embeddings = normalize_rows(embeddings)
+    coarse_order, coarse_offsets = membership_order(norm_embeddings, coarse_ids, coarse_centroids)
+    fine_order, fine_offsets = membership_order(norm_embeddings, fine_ids, fine_centroids)
 
-    coarse_clusters = []
-    for cid in range(COARSE_CLUSTER_COUNT):
-        mask = coarse_ids == cid
-        if not np.any(mask):
-            continue
-        coords = coords_array[mask]
-        x_mean, y_mean = coords.mean(axis=0)
-        count = int(mask.sum())
-        size = 10 + np.log1p(count) * 6
-        coarse_clusters.append(
-            {
-                "id": int(cid),
-                "label": coarse_labels.get(cid, f"Topic {cid}"),
-                "x": float(x_mean),
-                "y": float(y_mean),
-                "size": float(size),
-                "count": count,
-            }
+    labeler = make_labeler(openai_client)
+    if labeler is not None:
+        print(f"Refining cluster names with {labeler.name}...")
+        jobs = label_jobs(
+            ArticleTable.from_raw(df["id"].to_numpy(), {"headline": df["headline"].tolist()}),
+            [{"id": cid, "label": coarse_labels[cid]} for cid in range(COARSE_CLUSTER_COUNT)],
+            [{"id": cid, "label": fine_labels[cid]} for cid in range(fine_count)],
+            ClusterMembership(coarse_order, coarse_offsets),
+            ClusterMembership(fine_order, fine_offsets),
         )
+        refined, stats = label_clusters(jobs, labeler, cache=LabelCache())
+        if labeler.cacheable:
+            for (level, cid), label in refined.items():
+                (coarse_labels if level == "coarse" else fine_labels)[cid] = label
+        else:
+            print("Stub labels are discarded; keeping the TF-IDF names.")
+        print(f"Labeling stats: {stats}")
 
-    parent_fine_ids = np.full(FINE_CLUSTER_COUNT, -1, dtype=np.int32)
-    fine_clusters = []
-    for fid in range(FINE_CLUSTER_COUNT):
-        mask = fine_ids == fid
-        if not np.any(mask):
-            continue
-        member_coarse = coarse_ids[mask]
-        counts = np.bincount(member_coarse, minlength=COARSE_CLUSTER_COUNT)
-        parent = int(counts.argmax())
-        parent_fine_ids[fid] = parent
-        coords = coords_array[mask]
-        x_mean, y_mean = coords.mean(axis=0)
-        count = int(mask.sum())
-        size = 6 + np.log1p(count) * 4
-        fine_clusters.append(
-            {
-                "id": int(fid),
-                "label": fine_labels.get(fid, f"Subtopic {fid}"),
-                "parent_id": parent,
-                "x": float(x_mean),
-                "y": float(y_mean),
-                "size": float(size),
-                "count": count,
-            }
-        )
+    print("Summarizing clusters for the map...")
+    coords_array = np.asarray(coords_2d)
+    coarse_clusters, fine_clusters, parent_fine_ids, map_bounds = summarize_clusters(
+        coords_array,
+        coarse_ids,
+        fine_ids,
+        coarse_labels,
+        fine_labels,
+        COARSE_CLUSTER_COUNT,
+        fine_count,
+        parent_fine_ids=fine_parents,
+    )
 
     index = {
-        "articles": df.to_dict(orient="records"),
-        "embeddings": embeddings.astype("float32"),
+        "embeddings": norm_embeddings,
         "coords_2d": coords_array.astype("float32"),
         "coarse_ids": coarse_ids.astype("int32"),
         "fine_ids": fine_ids.astype("int32"),
         "parent_fine_ids": parent_fine_ids.astype("int32"),
+        "coarse_centroids": coarse_centroids,
+        "fine_centroids": fine_centroids,
+        "coarse_order": coarse_order,
+        "coarse_offsets": coarse_offsets,
+        "fine_order": fine_order,
+        "fine_offsets": fine_offsets,
         "coarse_clusters": coarse_clusters,
         "fine_clusters": fine_clusters,
         "coarse_cluster_labels": coarse_labels,
         "fine_cluster_labels": fine_labels,
         "map_bounds": map_bounds,
+        "lexical": lexical,
     }
 
-    out_path = DATA_DIR / "index.pkl"
-    joblib.dump(index, out_path)
+    out_path = write_index(
+        index, df, model_name=EMBEDDING_MODEL_NAME, model_fingerprint=model_fingerprint()
+    )
     print(f"Saved index to {out_path}")
 
 
@@ -0,0 +1,67 @@
+"""Split long uploads into overlapping, sentence-aligned chunks.
+
+MiniLM reads at most 256 word pieces, so a long document embedded as one
+string is placed by its opening paragraph only. Chunks of about
+``max_words`` words keep each piece inside the model window; consecutive
+chunks share roughly ``overlap_words`` words of trailing sentences so a
+point made across a boundary is seen whole at least once.
+"""
+import re
+from typing import List, NamedTuple
+
+import numpy as np
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+_WORD = re.compile(r"\S+")
+
+
+class Chunk(NamedTuple):
+    text: str
+    start: int  # character offsets into the (possibly truncated) input
+    end: int
+
+
+def _sentences(text: str, max_words: int):
+    """``(start, end, word_count)`` spans; sentences longer than ``max_words`` are cut."""
+    spans = []
+    pos = 0
+    for match in list(_SENTENCE_END.finditer(text)) + [None]:
+        end = match.start() if match else len(text)
+        words = [(w.start() + pos, w.end() + pos) for w in _WORD.finditer(text[pos:end])]
+        for i in range(0, len(words), max_words):
+            piece = words[i : i + max_words]
+            spans.append((piece[0][0], piece[-1][1], len(piece)))
+        pos = match.end() if match else len(text)
+    return spans
+
+
+def chunk_text(
+    text: str, max_words: int = 180, overlap_words: int = 40, max_chunks: int = 64
+) -> List[Chunk]:
+    """Pack whole sentences into chunks of at most ``max_words`` words.
+
+    If the document needs more than ``max_chunks`` chunks, an evenly spaced
+    subset is kept so the whole document is still represented.
+    """
+    spans = _sentences(text, max_words)
+    chunks = []
+    i = 0
+    while i < len(spans):
+        j, words = i, 0
+        while j < len(spans) and (j == i or words + spans[j][2] <= max_words):
+            words += spans[j][2]
+            j += 1
+        start, end = spans[i][0], spans[j - 1][1]
+        chunks.append(Chunk(text[start:end], start, end))
+        if j >= len(spans):
+            break
+        # Step back over trailing sentences to overlap, but always advance.
+        back, overlap = j, 0
+        while back - 1 > i and overlap + spans[back - 1][2] <= overlap_words:
+            back -= 1
+            overlap += spans[back][2]
+        i = back
+    if len(chunks) > max_chunks:
+        keep = np.unique(np.linspace(0, len(chunks) - 1, max_chunks).round().astype(int))
+        chunks = [chunks[k] for k in keep]
+    return chunks
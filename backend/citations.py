@@ -0,0 +1,405 @@
+"""APA citations for articles and the persistent citation cache.
+
+Citations from the model are stored in ``data/citations.db`` (SQLite), keyed by
+a hash of the normalized request fields plus the model and prompt version, so
+the same article cited from any session or worker costs one OpenAI call ever.
+Fallback citations are never cached; a later request retries the model.
+
+``CitationFiller`` generates misses on a small thread pool so the batch
+endpoint can answer with fallbacks at once and have the model's citations
+cached for the next request. Precompute the whole index offline with:
+
+    python citations.py               # cite every article not cached yet
+    python citations.py --limit 5000  # ... or only the first 5000 rows
+    python citations.py --stub 0.2    # time it with a fake 200 ms client
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from config import DATA_DIR
+
+CITATION_CACHE_PATH = DATA_DIR / "citations.db"
+CITATION_MODEL = "gpt-4o-mini"
+# Bump when the prompt changes so old cache entries stop matching.
+PROMPT_VERSION = 1
+DEFAULT_SOURCE = "The New York Times"
+FIELDS = ("headline", "pub_date", "url", "section", "authors", "source")
+
+MONTH_NAMES = [
+    "January",
+    "February",
+    "March",
+    "April",
+    "May",
+    "June",
+    "July",
+    "August",
+    "September",
+    "October",
+    "November",
+    "December",
+]
+
+
+def _format_author(name: str) -> str:
+    if not name:
+        return ""
+    parts = name.strip().replace("By ", "").replace("by ", "").split()
+    if len(parts) == 1:
+        return parts[0].rstrip(",")
+    last = parts[-1].rstrip(",")
+    initials = [p[0].upper() + "." for p in parts[:-1] if p]
+    return f"{last}, {' '.join(initials)}"
+
+
+def _format_author_list(authors: List[str]) -> Optional[str]:
+    formatted = [fmt for fmt in (_format_author(a) for a in authors) if fmt]
+    if not formatted:
+        return None
+    if len(formatted) == 1:
+        return formatted[0]
+    if len(formatted) == 2:
+        return " & ".join(formatted)
+    return ", ".join(formatted[:-1]) + f", & {formatted[-1]}"
+
+
+def _format_date(date_str: Optional[str]) -> str:
+    if not date_str:
+        return "n.d."
+    try:
+        clean = date_str.replace("Z", "+00:00")
+        dt = datetime.fromisoformat(clean)
+        month = MONTH_NAMES[dt.month - 1]
+        day = dt.day
+        return f"{dt.year}, {month} {day}"
+    except Exception:
+        return date_str
+
+
+def _clean_title(title: Optional[str]) -> str:
+    if not title:
+        return "Untitled article"
+    title = title.strip()
+    return title[:-1] if title.endswith(".") else title
+
+
+def fallback_citation(fields: dict) -> str:
+    author_text = _format_author_list(fields.get("authors") or [])
+    date_text = _format_date(fields.get("pub_date"))
+    title = _clean_title(fields.get("headline"))
+    source = fields.get("source") or DEFAULT_SOURCE
+    url = fields.get("url") or ""
+    if author_text:
+        citation = f"{author_text} ({date_text}). {title}. {source}. {url}".strip()
+    else:
+        citation = f"{title}. ({date_text}). {source}. {url}".strip()
+    return citation
+
+
+def citation_prompt(fields: dict) -> str:
+    return (
+        "Format the following metadata as an APA 7 reference for a news article.\n"
+        "Use the pattern: Author, A. A., & Author, B. B. (Year, Month Day). Title of article. Source. URL\n"
+        "If no author is available, start with the title. Keep capitalization per APA rules. "
+        "Return only the citation line.\n"
+        f"Headline: {fields.get('headline')}\n"
+        f"Authors: {', '.join(fields.get('authors') or [])}\n"
+        f"Publication date: {fields.get('pub_date')}\n"
+        f"Section: {fields.get('section')}\n"
+        f"Source: {fields.get('source')}\n"
+        f"URL: {fields.get('url')}"
+    )
+
+
+class CitationClient:
+    """One OpenAI call per citation. No retries: a failure means the fallback
+    is served now and the next request tries again."""
+
+    def __init__(self, client, model: str = CITATION_MODEL):
+        self.client = client
+        self.model = model
+
+    def cite(self, fields: dict) -> str:
+        response = self.client.responses.create(model=self.model, input=citation_prompt(fields))
+        return (response.output_text or "").strip()
+
+
+class StubCitationClient:
+    """Offline stand-in for timing: the fallback citation after a fixed delay."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def cite(self, fields: dict) -> str:
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return fallback_citation(fields)
+
+
+def ai_citation(client, fields: dict) -> Optional[str]:
+    """The model's citation, or None if there is no client or the call fails."""
+    if client is None:
+        return None
+    try:
+        return client.cite(fields) or None
+    except Exception:
+        return None
+
+
+def _clean(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = " ".join(str(value).split())
+    return value or None
+
+
+def normalize_fields(fields: dict) -> dict:
+    """Collapse whitespace and treat empty strings as missing."""
+    authors = [a for a in (_clean(a) for a in fields.get("authors") or []) if a]
+    normalized = {name: _clean(fields.get(name)) for name in FIELDS if name != "authors"}
+    normalized["authors"] = authors
+    return normalized
+
+
+def citation_key(fields: dict) -> str:
+    payload = {**normalize_fields(fields), "model": CITATION_MODEL, "prompt": PROMPT_VERSION}
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+def article_fields(article: dict) -> dict:
+    """The fields the frontend's ``createCitation`` sends for an index article.
+
+    Mirrors frontend/src/api.js (including its byline split) so precomputed
+    keys match what the browser asks for.
+    """
+    byline = article.get("byline") or ""
+    authors = [
+        part.strip()
+        for part in re.split(r",|and|&", re.sub(r"^by\s+", "", byline, flags=re.IGNORECASE))
+        if part.strip()
+    ] if byline else []
+    return {
+        "headline": article.get("headline") or "Untitled Article",
+        "pub_date": article.get("pub_date"),
+        "url": article.get("url") or "",
+        "section": article.get("section") or "Unknown section",
+        "source": DEFAULT_SOURCE,
+        "authors": authors,
+    }
+
+
+class CitationCache:
+    """key -> citation in SQLite; safe to share between threads and workers."""
+
+    def __init__(self, path: Path = CITATION_CACHE_PATH):
+        self.path = Path(path)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS citations "
+                "(key TEXT PRIMARY KEY, citation TEXT NOT NULL, created REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        conn = self._connect()
+        for start in range(0, len(keys), 500):
+            chunk = keys[start : start + 500]
+            marks = ",".join("?" * len(chunk))
+            found.update(
+                conn.execute(
+                    f"SELECT key, citation FROM citations WHERE key IN ({marks})", chunk
+                ).fetchall()
+            )
+        return found
+
+    def get(self, key: str) -> Optional[str]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: Dict[str, str]):
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO citations (key, citation, created) VALUES (?, ?, ?)",
+                [(key, citation, now) for key, citation in items.items()],
+            )
+
+    def put(self, key: str, citation: str):
+        self.put_many({key: citation})
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM citations").fetchone()[0]
+
+
+def cached_citation(cache: CitationCache, client, fields: dict) -> str:
+    """Cache hit, else the model's citation (then cached), else the fallback."""
+    key = citation_key(fields)
+    citation = cache.get(key)
+    if citation is None:
+        citation = ai_citation(client, fields)
+        if citation is None:
+            return fallback_citation(fields)
+        cache.put(key, citation)
+    return citation
+
+
+class CitationFiller:
+    """Generate cache misses in the background on ``workers`` threads.
+
+    At most ``max_pending`` citations are queued or running at once, and a key
+    already in flight is not submitted twice.
+    """
+
+    def __init__(self, cache: CitationCache, client, workers: int = 4, max_pending: int = 200):
+        self.cache = cache
+        self.client = client
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="citations")
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, fields: dict) -> bool:
+        """Queue one miss; False if it is over the pending cap."""
+        with self._lock:
+            if key in self._pending:
+                return True
+            if len(self._pending) >= self.max_pending:
+                return False
+            self._pending.add(key)
+        self._pool.submit(self._fill, key, fields)
+        return True
+
+    def _fill(self, key: str, fields: dict):
+        try:
+            citation = ai_citation(self.client, fields)
+            if citation is not None:
+                self.cache.put(key, citation)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def precompute(
+    cache: CitationCache,
+    client,
+    articles,
+    rows: Iterable[int],
+    workers: int = 8,
+    budget: Optional[int] = None,
+    save_every: int = 200,
+) -> dict:
+    """Cite every article in ``rows`` that is not cached yet.
+
+    At most ``budget`` model requests are made. Results are written in
+    batches of ``save_every``, so an interrupted run keeps its progress.
+    """
+    stats = {"cached": 0, "requested": 0, "failed": 0, "over_budget": 0}
+    todo = {}
+    for row in rows:
+        fields = article_fields(articles[int(row)])
+        todo.setdefault(citation_key(fields), fields)
+    hits = cache.get_many(todo)
+    stats["cached"] = len(hits)
+    missing = [(key, fields) for key, fields in todo.items() if key not in hits]
+    if budget is not None and len(missing) > budget:
+        stats["over_budget"] = len(missing) - budget
+        missing = missing[:budget]
+
+    def run(item):
+        key, fields = item
+        return key, ai_citation(client, fields)
+
+    done = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for key, citation in pool.map(run, missing):
+            stats["requested"] += 1
+            if citation is None:
+                stats["failed"] += 1
+                continue
+            done[key] = citation
+            if len(done) >= save_every:
+                cache.put_many(done)
+                done = {}
+    if done:
+        cache.put_many(done)
+    return stats
+
+
+def main():
+    import tempfile
+
+    from dotenv import load_dotenv
+    from openai import OpenAI
+
+    from index_store import load_index
+
+    parser = argparse.ArgumentParser(description="Precompute citations for indexed articles.")
+    parser.add_argument("--limit", type=int, help="only the first N articles")
+    parser.add_argument("--budget", type=int, help="at most this many model requests")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument(
+        "--stub",
+        type=float,
+        metavar="LATENCY",
+        help="benchmark with a fake client of this latency (seconds); nothing is saved",
+    )
+    args = parser.parse_args()
+
+    articles = load_index()["articles"]
+    rows = range(min(args.limit or len(articles), len(articles)))
+
+    if args.stub is not None:
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            stats = precompute(
+                CitationCache(Path(tmp) / "citations.db"),
+                StubCitationClient(args.stub),
+                articles,
+                rows,
+                workers=args.workers,
+                budget=args.budget,
+            )
+            elapsed = time.perf_counter() - start
+        print(f"{len(rows)} articles, {args.workers} workers: {elapsed:.2f}s {stats}")
+        return
+
+    load_dotenv()
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise SystemExit("OPENAI_API_KEY is not set.")
+    cache = CitationCache()
+    client = CitationClient(OpenAI(api_key=api_key))
+    stats = precompute(cache, client, articles, rows, workers=args.workers, budget=args.budget)
+    print(f"Citations {stats}; {len(cache)} cached in {cache.path}")
+
+
+if __name__ == "__main__":
+    main()
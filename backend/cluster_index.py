@@ -0,0 +1,91 @@
+from typing import Optional
+
+import numpy as np
+
+from vector_index import cluster_lists, top_k
+
+MISSING_TS = np.iinfo(np.int64).min
+
+
+def parse_pub_dates(values) -> np.ndarray:
+    """Publication dates as int64 epoch seconds; unparseable dates become MISSING_TS."""
+    import pandas as pd
+
+    parsed = pd.to_datetime(
+        pd.Series(list(values), dtype=object), utc=True, errors="coerce", format="ISO8601"
+    )
+    seconds = (parsed - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+    ts = np.full(len(parsed), MISSING_TS, dtype=np.int64)
+    valid = parsed.notna().to_numpy()
+    ts[valid] = seconds[valid].astype("int64").to_numpy()
+    return ts
+
+
+def membership_order(
+    embeddings: np.ndarray,
+    assignments: np.ndarray,
+    centroids: np.ndarray,
+    chunk_size: int = 65536,
+):
+    """CSR membership sorted by closeness to each cluster's centroid.
+
+    Returns ``(order, offsets)``: members of cluster c are
+    ``order[offsets[c]:offsets[c + 1]]``, most central first.
+    """
+    assignments = np.asarray(assignments)
+    sims = np.empty(assignments.shape[0], dtype=np.float32)
+    for start in range(0, assignments.shape[0], chunk_size):
+        end = start + chunk_size
+        block = np.asarray(embeddings[start:end], dtype=np.float32)
+        sims[start:end] = np.einsum("ij,ij->i", block, centroids[assignments[start:end]])
+    order = np.lexsort((-sims, assignments))
+    _, offsets = cluster_lists(assignments, centroids.shape[0])
+    return order.astype(np.int64), offsets
+
+
+class ClusterMembership:
+    """Cluster -> member rows without scanning the corpus."""
+
+    def __init__(self, order: np.ndarray, offsets: np.ndarray):
+        self.order = order
+        self.offsets = offsets
+
+    @classmethod
+    def from_assignments(cls, assignments: np.ndarray, n_clusters: int):
+        return cls(*cluster_lists(assignments, n_clusters))
+
+    def __len__(self) -> int:
+        return int(self.offsets.shape[0] - 1)
+
+    def count(self, cid: int) -> int:
+        return int(self.offsets[cid + 1] - self.offsets[cid])
+
+    def members(self, cid: int) -> np.ndarray:
+        return self.order[self.offsets[cid] : self.offsets[cid + 1]]
+
+    def page(
+        self,
+        cid: int,
+        offset: int,
+        limit: int,
+        sort_keys: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Members ``[offset, offset + limit)``; by stored order, or by ``sort_keys`` descending."""
+        members = self.members(cid)
+        if sort_keys is None:
+            return members[offset : offset + limit]
+        best = top_k(np.asarray(sort_keys[members]), offset + limit)
+        return members[best[offset:]]
+
+
+def load_membership(index: dict, level: str, centroids=None) -> ClusterMembership:
+    """Stored CSR membership, rebuilt for indexes written before it was persisted."""
+    order = index.get(f"{level}_order")
+    if order is not None:
+        return ClusterMembership(order, index[f"{level}_offsets"])
+    assignments = index[f"{level}_ids"]
+    if centroids is None:
+        centroids = index.get(f"{level}_centroids")
+    if centroids is not None:
+        return ClusterMembership(*membership_order(index["embeddings"], assignments, centroids))
+    return ClusterMembership.from_assignments(assignments, int(assignments.max()) + 1)
@@ -0,0 +1,98 @@
+"""Coarse and fine k-means for build_index.py.
+
+``independent`` fits both levels on the full matrix; each fine cluster's parent
+is the coarse cluster most of its members fall in. ``nested`` fits the coarse
+level first and then a small k-means inside every coarse cluster, spread over
+a process pool, so each fine cluster has exactly one parent by construction.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+
+from config import CLUSTER_MODE, CLUSTER_WORKERS
+from vector_index import normalize_rows
+
+
+def _kmeans(embeddings, n_clusters, random_state, n_init=10):
+    kmeans = MiniBatchKMeans(
+        n_clusters=n_clusters,
+        random_state=random_state,
+        batch_size=512,
+        n_init=n_init,
+    )
+    ids = kmeans.fit_predict(embeddings)
+    return ids.astype(np.int32), normalize_rows(kmeans.cluster_centers_)
+
+
+def _fit_fine(job):
+    embeddings, n_clusters, random_state = job
+    if n_clusters <= 1:
+        center = normalize_rows(embeddings.mean(axis=0, keepdims=True))
+        return np.zeros(len(embeddings), dtype=np.int32), center
+    return _kmeans(embeddings, n_clusters, random_state, n_init=3)
+
+
+def fine_quota(sizes: np.ndarray, total: int) -> np.ndarray:
+    """Split ``total`` fine clusters across coarse clusters by size (largest
+    remainder). Every non-empty cluster gets at least one, even if that means
+    exceeding ``total``, and never more than it has members."""
+    sizes = np.asarray(sizes, dtype=np.int64)
+    total = min(total, int(sizes.sum()))
+    share = sizes * total / max(int(sizes.sum()), 1)
+    quota = np.minimum(np.maximum(np.floor(share).astype(np.int64), sizes > 0), sizes)
+    by_remainder = np.argsort(np.floor(share) - share, kind="stable")
+    while quota.sum() < total:
+        for cid in by_remainder:
+            if quota.sum() == total:
+                break
+            if quota[cid] < sizes[cid]:
+                quota[cid] += 1
+    while quota.sum() > total and quota.max() > 1:
+        quota[int(np.argmax(quota))] -= 1
+    return quota
+
+
+def nested_kmeans(embeddings, coarse_ids, coarse_count, fine_count, workers=CLUSTER_WORKERS):
+    sizes = np.bincount(coarse_ids, minlength=coarse_count)
+    quota = fine_quota(sizes, fine_count)
+    members = np.split(np.argsort(coarse_ids, kind="stable"), np.cumsum(sizes)[:-1])
+    jobs = [
+        (embeddings[members[cid]], int(quota[cid]), 123 + cid)
+        for cid in range(coarse_count)
+        if quota[cid] > 0
+    ]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            results = list(pool.map(_fit_fine, jobs))
+    else:
+        results = [_fit_fine(job) for job in jobs]
+
+    fine_ids = np.empty(len(embeddings), dtype=np.int32)
+    centroids, parents = [], []
+    offset = 0
+    for cid, (local_ids, local_centroids) in zip(np.flatnonzero(quota), results):
+        fine_ids[members[cid]] = local_ids + offset
+        centroids.append(local_centroids)
+        parents.extend([cid] * len(local_centroids))
+        offset += len(local_centroids)
+    return fine_ids, np.concatenate(centroids), np.asarray(parents, dtype=np.int32)
+
+
+def fit_clusters(embeddings, coarse_count, fine_count, mode=CLUSTER_MODE):
+    """(coarse_ids, coarse_centroids, fine_ids, fine_centroids, parent_fine_ids).
+
+    ``parent_fine_ids`` is None in independent mode; the summary stage votes.
+    """
+    coarse_ids, coarse_centroids = _kmeans(embeddings, coarse_count, random_state=42)
+    if mode == "nested":
+        fine_ids, fine_centroids, parents = nested_kmeans(
+            embeddings, coarse_ids, coarse_count, fine_count
+        )
+        return coarse_ids, coarse_centroids, fine_ids, fine_centroids, parents
+    if mode != "independent":
+        raise ValueError(f"Unknown cluster mode: {mode}")
+    fine_ids, fine_centroids = _kmeans(embeddings, fine_count, random_state=123)
+    return coarse_ids, coarse_centroids, fine_ids, fine_centroids, None
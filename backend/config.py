@@ -3,11 +3,50 @@ from pathlib import Path
 BASE_DIR = Path(__file__).resolve().parent
 DATA_DIR = BASE_DIR / "data"
 DATA_DIR.mkdir(exist_ok=True)
+INDEX_DIR = DATA_DIR / "index"
+# Text embeddings reused across builds, one subdirectory per model
+EMBEDDING_CACHE_DIR = DATA_DIR / "embedding_cache"
+# Prepared article samples (Parquet), keyed by source file, N and seed
+SNAPSHOT_DIR = DATA_DIR / "snapshots"
 
 # How many articles to sample from Kaggle dataset
 N_ARTICLES = 8000
 
 EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# Inference backend for the embedding model: "torch" (eager PyTorch), "onnx"
+# (ONNX Runtime) or "onnx-int8" (dynamically quantized ONNX weights). Both ONNX
+# options need `pip install sentence-transformers[onnx]`. Check a backend
+# against torch with `python embedding_model.py --check onnx-int8` first.
+EMBEDDING_BACKEND = "torch"
+EMBEDDING_ONNX_INT8_FILE = "onnx/model_quint8_avx2.onnx"
+EMBEDDING_THREADS = None  # intra-op threads; None = library default
+EMBEDDING_MAX_SEQ_LENGTH = None  # tokens per text; None = model default (256)
+EMBEDDING_WARMUP = True  # run throwaway encodes when the API starts
+# Compact copy of the embeddings written with each index for the first search
+# pass: "int8", "float16" or None
+EMBEDDING_QUANTIZATION = "int8"
 TSNE_PERPLEXITY = 35
+# 2D map layout: "exact" t-SNE, "landmark" (t-SNE on a per-fine-cluster sample,
+# kNN interpolation for the rest) or "auto" (landmark above LAYOUT_EXACT_MAX)
+LAYOUT_MODE = "auto"
+LAYOUT_EXACT_MAX = 20000
+LAYOUT_LANDMARKS = 10000
+# update_index.py finds map neighbors for new articles by probing this many
+# fine clusters once the corpus has more than LAYOUT_EXACT_MAX articles
+UPDATE_NPROBE = 32
+# Vocabulary cap for the keyword-search postings: the most frequent unigrams
+# and bigrams are kept (None keeps every term, at the cost of a much larger
+# vocabulary to load at API startup; cluster labels use their own 6000)
+LEXICAL_MAX_FEATURES = 200000
 COARSE_CLUSTER_COUNT = 40
 FINE_CLUSTER_COUNT = 200
+# "independent": two k-means over everything, fine parents by majority vote;
+# "nested": fine k-means inside each coarse cluster (exact parents, parallel).
+# Nested changes cluster structure, and the fine count can differ from
+# FINE_CLUSTER_COUNT, so it is opt-in.
+CLUSTER_MODE = "independent"
+CLUSTER_WORKERS = None  # processes for nested fine clustering; None = all cores
+
+# OpenAI cluster naming: parallel requests and max requests per build
+LABEL_WORKERS = 8
+LABEL_REQUEST_BUDGET = 500
@@ -1,24 +1,19 @@
+import hashlib
+import os
+
 import kagglehub
+import numpy as np
 import pandas as pd
 from pathlib import Path
-from config import N_ARTICLES
-
+from config import N_ARTICLES, SNAPSHOT_DIR
 
-def load_sample(n=N_ARTICLES, random_state=42) -> pd.DataFrame:
-    # Download dataset via kagglehub
-    path = kagglehub.dataset_download("aryansingh0909/nyt-articles-21m-2000-present")
-    path = Path(path)
-
-    # Adjust this if the filename differs in the Kaggle dataset
-    csv_path = path / "nyt-metadata.csv"
-    if not csv_path.exists():
-        # try fallback names
-        for alt in path.glob("*.csv"):
-            csv_path = alt
-            break
+try:
+    import pyarrow  # noqa: F401  (pandas' Parquet engine)
+except ImportError:  # optional: without it every build re-samples the CSV
+    pyarrow = None
 
-    df = pd.read_csv(csv_path)
 
+def _find_text_columns(df: pd.DataFrame):
     # Try to be robust to column naming
     # headline-ish column
     headline_col = None
@@ -39,13 +34,16 @@ def load_sample(n=N_ARTICLES, random_state=42) -> pd.DataFrame:
         raise ValueError("Could not find a headline/title column in NYT metadata.")
     if abstract_col is None:
         abstract_col = headline_col  # fallback
+    return headline_col, abstract_col
+
+
+def prepare_articles(df: pd.DataFrame) -> pd.DataFrame:
+    """Map raw NYT metadata columns onto id/headline/abstract/text/pub_date/section/url."""
+    headline_col, abstract_col = _find_text_columns(df)
 
     # Drop rows missing both headline and abstract
     df = df.dropna(subset=[headline_col, abstract_col])
 
-    # Sample subset for hackathon scale
-    df = df.sample(n=min(n, len(df)), random_state=random_state)
-
     # Normalized columns
     df = df.rename(columns={
         headline_col: "headline",
@@ -92,3 +90,114 @@ def load_sample(n=N_ARTICLES, random_state=42) -> pd.DataFrame:
         df = df.reset_index().rename(columns={"index": "id"})
 
     return df[["id", "headline", "abstract", "text", "pub_date", "section", "url"]]
+
+
+def _dataset_csv() -> Path:
+    # Download dataset via kagglehub
+    path = kagglehub.dataset_download("aryansingh0909/nyt-articles-21m-2000-present")
+    path = Path(path)
+
+    # Adjust this if the filename differs in the Kaggle dataset
+    csv_path = path / "nyt-metadata.csv"
+    if not csv_path.exists():
+        # try fallback names
+        for alt in path.glob("*.csv"):
+            csv_path = alt
+            break
+    return csv_path
+
+
+def _first_column(columns, exact, needle):
+    if exact in columns:
+        return exact
+    for c in columns:
+        if needle in c.lower():
+            return c
+    return None
+
+
+def _needed_columns(header: pd.DataFrame):
+    """The raw columns prepare_articles will pick, plus the text columns."""
+    headline_col, abstract_col = _find_text_columns(header)
+    wanted = [headline_col, abstract_col, "id"]
+    wanted += [
+        _first_column(header.columns, "pub_date", "date"),
+        _first_column(header.columns, "section", "section"),
+        _first_column(header.columns, "url", "url"),
+    ]
+    keep = set(c for c in wanted if c in header.columns)
+    # Preserve file order so prepare_articles resolves the same columns.
+    return [c for c in header.columns if c in keep], headline_col, abstract_col
+
+
+def sample_csv(csv_path, n, random_state=42, chunksize=200_000) -> pd.DataFrame:
+    """Seeded uniform sample of ``n`` rows with a headline and abstract.
+
+    Streams the file in chunks, reading only the needed columns as strings.
+    Every row gets a random key from one seeded stream and the ``n`` smallest
+    keys win (bottom-k reservoir sampling), so peak memory is one chunk plus
+    the sample and the result depends only on the file and ``random_state``.
+    Row ids are positions in the full file, as with the old full read.
+    """
+    header = pd.read_csv(csv_path, nrows=0)
+    usecols, headline_col, abstract_col = _needed_columns(header)
+    dtypes = {c: str for c in usecols if c != "id"}
+    rng = np.random.default_rng(random_state)
+
+    sample = None
+    threshold = np.inf
+    for chunk in pd.read_csv(csv_path, usecols=usecols, dtype=dtypes, chunksize=chunksize):
+        # Draw keys for every row, kept or not, so keys do not depend on chunksize.
+        keys = rng.random(len(chunk))
+        keep = chunk[headline_col].notna().to_numpy() & chunk[abstract_col].notna().to_numpy()
+        keep &= keys < threshold
+        if not keep.any():
+            continue
+        chunk = chunk[keep].assign(_key=keys[keep])
+        sample = chunk if sample is None else pd.concat([sample, chunk])
+        if len(sample) > n:
+            sample = sample.nsmallest(n, "_key")
+        if len(sample) >= n:
+            threshold = sample["_key"].max()
+
+    if sample is None:
+        return header.iloc[:0]
+    return sample.sort_values("_key").drop(columns="_key")
+
+
+def source_fingerprint(path: Path, probe_bytes: int = 1 << 20) -> str:
+    """Cheap identity for a large file: size, mtime and its first/last MiB."""
+    stat = path.stat()
+    digest = hashlib.sha1(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    with open(path, "rb") as fh:
+        digest.update(fh.read(probe_bytes))
+        if stat.st_size > probe_bytes:
+            fh.seek(max(probe_bytes, stat.st_size - probe_bytes))
+            digest.update(fh.read(probe_bytes))
+    return digest.hexdigest()[:16]
+
+
+def snapshot_path(csv_path: Path, n, random_state) -> Path:
+    return SNAPSHOT_DIR / f"{source_fingerprint(csv_path)}-n{n}-seed{random_state}.parquet"
+
+
+def _write_snapshot(df: pd.DataFrame, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".tmp{os.getpid()}")
+    df.to_parquet(tmp, index=False, compression="zstd")
+    os.replace(tmp, path)
+
+
+def load_sample(n=N_ARTICLES, random_state=42, use_snapshot=True) -> pd.DataFrame:
+    """Prepared sample of the NYT metadata, reused from a Parquet snapshot when possible."""
+    csv_path = _dataset_csv()
+    snapshot = snapshot_path(csv_path, n, random_state) if use_snapshot and pyarrow else None
+    if snapshot is not None and snapshot.exists():
+        print(f"Using prepared sample {snapshot.name}")
+        return pd.read_parquet(snapshot)
+
+    # Sample subset for hackathon scale
+    df = prepare_articles(sample_csv(csv_path, n, random_state=random_state))
+    if snapshot is not None:
+        _write_snapshot(df, snapshot)
+    return df
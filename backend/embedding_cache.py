@@ -0,0 +1,101 @@
+"""Content-addressed embedding cache shared by build_index.py and update_index.py.
+
+Each model gets its own directory under ``EMBEDDING_CACHE_DIR`` holding two
+append-only files:
+
+    keys.bin      16-byte blake2b digest of each cached text
+    vectors.f32   float32 rows in the same order (memory-mapped on read)
+    meta.json     {"model": ..., "dim": ...}
+
+Vectors are written before their keys, so a build killed mid-append leaves at
+most some orphan rows past the last key, which the next open ignores and the
+next append overwrites.
+"""
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from config import EMBEDDING_CACHE_DIR
+
+KEY_BYTES = 16
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+
+def _model_dir(root: Path, model_name: str) -> Path:
+    return root / re.sub(r"[^A-Za-z0-9._-]+", "__", model_name)
+
+
+class EmbeddingCache:
+    def __init__(self, model_name: str, root: Path = EMBEDDING_CACHE_DIR):
+        self.model_name = model_name
+        self.dir = _model_dir(root, model_name)
+        self.keys_path = self.dir / "keys.bin"
+        self.vectors_path = self.dir / "vectors.f32"
+        self.meta_path = self.dir / "meta.json"
+        self.dim = None
+        self.rows = {}
+        self._vectors = None
+        if self.meta_path.exists():
+            self.dim = json.loads(self.meta_path.read_text())["dim"]
+            self._open()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _open(self):
+        keys = np.fromfile(self.keys_path, dtype=f"S{KEY_BYTES}") if self.keys_path.exists() else []
+        row_bytes = self.dim * 4
+        stored = self.vectors_path.stat().st_size // row_bytes if self.vectors_path.exists() else 0
+        n = min(len(keys), stored)
+        # np.fromfile strips trailing NUL bytes from "S" items; pad them back.
+        self.rows = {bytes(k).ljust(KEY_BYTES, b"\0"): i for i, k in enumerate(keys[:n])}
+        self._vectors = (
+            np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+            if n
+            else np.empty((0, self.dim), dtype=np.float32)
+        )
+
+    def _append(self, keys: List[bytes], vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+            self.dir.mkdir(parents=True, exist_ok=True)
+            self.meta_path.write_text(json.dumps({"model": self.model_name, "dim": self.dim}))
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Cached {self.model_name} vectors are {self.dim}-dim, got {vectors.shape[1]}")
+        n = len(self.rows)
+        self._vectors = None  # drop the map before the file grows
+        with open(self.vectors_path, "r+b" if self.vectors_path.exists() else "wb") as fh:
+            fh.seek(n * self.dim * 4)
+            fh.write(vectors.tobytes())
+            fh.truncate()
+        with open(self.keys_path, "r+b" if self.keys_path.exists() else "wb") as fh:
+            fh.seek(n * KEY_BYTES)
+            fh.write(b"".join(keys))
+            fh.truncate()
+        self._open()
+
+    def encode(self, model, texts: List[str], batch_size: int = 64, **encode_kwargs) -> np.ndarray:
+        """Embeddings for ``texts``; only texts missing from the cache reach ``model``."""
+        keys = [text_key(t) for t in texts]
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self.rows and key not in missing:
+                missing[key] = text
+        if missing:
+            print(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} to encode")
+            encoded = model.encode(list(missing.values()), batch_size=batch_size, **encode_kwargs)
+            self._append(list(missing), np.asarray(encoded))
+        else:
+            print(f"Embedding cache: all {len(texts)} texts cached")
+        if not texts:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        rows = np.fromiter((self.rows[k] for k in keys), dtype=np.int64, count=len(keys))
+        return np.asarray(self._vectors[rows])
@@ -0,0 +1,163 @@
+"""Load the sentence embedding model with the configured inference backend.
+
+``load_embedding_model`` is what build_index.py, update_index.py and the API
+use. ``python embedding_model.py --check onnx-int8`` embeds a sample of
+indexed articles with both the reference torch model and the candidate
+backend and fails if top-k neighbor overlap drops below the threshold, so a
+faster backend never silently changes search results.
+"""
+import argparse
+import sys
+import time
+from typing import Optional
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from config import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_MAX_SEQ_LENGTH,
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_ONNX_INT8_FILE,
+    EMBEDDING_THREADS,
+)
+
+try:
+    import onnxruntime
+except ImportError:  # optional: only the onnx backends need it
+    onnxruntime = None
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def _onnx_kwargs(threads: Optional[int], file_name: Optional[str] = None) -> dict:
+    if onnxruntime is None:
+        raise RuntimeError(
+            "The onnx embedding backends need `pip install sentence-transformers[onnx]`."
+        )
+    kwargs = {"provider": "CPUExecutionProvider"}
+    if file_name:
+        kwargs["file_name"] = file_name
+    if threads:
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        kwargs["session_options"] = options
+    return kwargs
+
+
+def load_embedding_model(
+    backend: str = EMBEDDING_BACKEND,
+    threads: Optional[int] = EMBEDDING_THREADS,
+    max_seq_length: Optional[int] = EMBEDDING_MAX_SEQ_LENGTH,
+    warmup: bool = False,
+    model_name: str = EMBEDDING_MODEL_NAME,
+):
+    """A ``SentenceTransformer`` on ``backend`` with thread and length limits applied.
+
+    ``warmup`` runs a few throwaway encodes so the first real request does not
+    pay for graph initialization and allocator growth.
+    """
+    if backend == "torch":
+        if threads:
+            import torch
+
+            torch.set_num_threads(threads)
+        model = SentenceTransformer(model_name)
+    elif backend == "onnx":
+        model = SentenceTransformer(model_name, backend="onnx", model_kwargs=_onnx_kwargs(threads))
+    elif backend == "onnx-int8":
+        model = SentenceTransformer(
+            model_name,
+            backend="onnx",
+            model_kwargs=_onnx_kwargs(threads, EMBEDDING_ONNX_INT8_FILE),
+        )
+    else:
+        raise ValueError(f"Unknown embedding backend {backend!r}; pick one of {BACKENDS}")
+    if max_seq_length:
+        model.max_seq_length = max_seq_length
+    if warmup:
+        start = time.perf_counter()
+        for size in (1, 8):
+            model.encode(["warm-up query"] * size, normalize_embeddings=True)
+        print(f"Embedding model ({backend}) warmed up in {time.perf_counter() - start:.2f}s")
+    return model
+
+
+def model_fingerprint(
+    backend: str = EMBEDDING_BACKEND,
+    max_seq_length: Optional[int] = EMBEDDING_MAX_SEQ_LENGTH,
+    model_name: str = EMBEDDING_MODEL_NAME,
+) -> str:
+    """Name for caches of this model's vectors; settings that change the
+    vectors (backend, sequence length) are part of it."""
+    name = model_name
+    if backend != "torch":
+        name += f"@{backend}"
+    if max_seq_length:
+        name += f"@len{max_seq_length}"
+    return name
+
+
+def _encode_timed(model, texts, batch_size=32):
+    start = time.perf_counter()
+    vectors = model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+    return np.asarray(vectors, dtype=np.float32), time.perf_counter() - start
+
+
+def check_backend(
+    backend: str, n_docs: int = 2000, n_queries: int = 200, k: int = 10, seed: int = 0
+) -> dict:
+    """Top-k neighbor overlap and per-text latency of ``backend`` vs torch."""
+    from index_store import load_index
+    from vector_index import top_k
+
+    articles = load_index()["articles"]
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(articles), size=min(n_docs + n_queries, len(articles)), replace=False)
+    table = articles.take(rows)
+    texts = [f"{h or ''}. {a or ''}" for h, a in zip(table["headline"], table["abstract"])]
+    docs, queries = texts[n_queries:], [h or "" for h in table["headline"][:n_queries]]
+
+    report = {"backend": backend, "k": k, "docs": len(docs), "queries": len(queries)}
+    results = {}
+    for name in ("torch", backend):
+        model = load_embedding_model(name, warmup=True)
+        doc_vecs, _ = _encode_timed(model, docs)
+        query_vecs, elapsed = _encode_timed(model, queries, batch_size=1)
+        results[name] = (doc_vecs, query_vecs)
+        report[f"{name}_ms_per_query"] = round(elapsed * 1000 / len(queries), 2)
+
+    ref_docs, ref_queries = results["torch"]
+    cand_docs, cand_queries = results[backend]
+    overlaps = []
+    for ref_q, cand_q in zip(ref_queries, cand_queries):
+        expected = set(top_k(ref_docs @ ref_q, k).tolist())
+        found = set(top_k(cand_docs @ cand_q, k).tolist())
+        overlaps.append(len(expected & found) / k)
+    report["topk_overlap"] = round(float(np.mean(overlaps)), 4)
+    report["min_topk_overlap"] = round(float(np.min(overlaps)), 4)
+    report["mean_cosine_to_torch"] = round(
+        float(np.mean(np.einsum("ij,ij->i", ref_docs, cand_docs))), 4
+    )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare an embedding backend against torch.")
+    parser.add_argument("--check", choices=BACKENDS, default=EMBEDDING_BACKEND)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--threshold", type=float, default=0.9, help="minimum mean top-k overlap")
+    args = parser.parse_args()
+
+    report = check_backend(args.check, n_docs=args.docs, n_queries=args.queries, k=args.k)
+    print(report)
+    if report["topk_overlap"] < args.threshold:
+        print(f"FAIL: top-{args.k} overlap {report['topk_overlap']} < {args.threshold}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Sequence
+
+import numpy as np
+
+
+class _Request:
+    __slots__ = ("texts", "future")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.future: Future = Future()
+
+
+class EmbeddingBatcher:
+    """Coalesce concurrent encode calls into one model forward pass.
+
+    Callers enqueue texts and get a future back. A single worker thread owns
+    the model: it takes the first waiting request, keeps collecting more for
+    up to ``max_wait_ms`` or until ``max_batch_size`` texts are queued, runs
+    one ``encode`` over the whole batch and hands each caller its rows.
+    """
+
+    def __init__(self, model, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.batches = 0
+        self.texts = 0
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self._worker = threading.Thread(
+            target=self._run, name="embedding-batcher", daemon=True
+        )
+        self._worker.start()
+
+    def submit(self, texts: Sequence[str]) -> Future:
+        """Queue texts for encoding; the future resolves to an (n, dim) array."""
+        request = _Request(list(texts))
+        # Under the lock, no request can land behind the shutdown marker.
+        with self._close_lock:
+            if self._closed:
+                raise RuntimeError("Embedding batcher is closed")
+            self._queue.put(request)
+        return request.future
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """Blocking helper for sync handlers (FastAPI runs them in its threadpool)."""
+        return self.submit(texts).result()
+
+    def close(self):
+        """Finish the requests already queued, then stop the worker.
+
+        Anything still queued once the worker is gone (it may outlive the
+        join timeout in a slow encode) fails instead of blocking its caller.
+        """
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._worker.join(timeout=5)
+        self._fail_queued()
+        # A worker still busy past the timeout exits at its next get.
+        self._queue.put(None)
+
+    def _fail_queued(self):
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None and item.future.set_running_or_notify_cancel():
+                item.future.set_exception(RuntimeError("Embedding batcher is closed"))
+
+    def _collect(self, first: _Request) -> List[_Request]:
+        batch = [first]
+        count = len(first.texts)
+        deadline = time.monotonic() + self.max_wait
+        while count < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = (
+                    self._queue.get(timeout=remaining)
+                    if remaining > 0
+                    else self._queue.get_nowait()
+                )
+            except queue.Empty:
+                break
+            if item is None:
+                # Re-queue the shutdown marker so the main loop exits after this batch.
+                self._queue.put(None)
+                break
+            batch.append(item)
+            count += len(item.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                self._fail_queued()
+                return
+            batch = [
+                req for req in self._collect(first) if req.future.set_running_or_notify_cancel()
+            ]
+            if not batch:
+                continue
+            texts = [text for req in batch for text in req.texts]
+            try:
+                vectors = self.model.encode(
+                    texts,
+                    batch_size=len(texts),
+                    normalize_embeddings=True,
+                    show_progress_bar=False,
+                )
+            except Exception as exc:
+                for req in batch:
+                    req.future.set_exception(exc)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            vectors = np.asarray(vectors, dtype=np.float32)
+            start = 0
+            for req in batch:
+                end = start + len(req.texts)
+                req.future.set_result(vectors[start:end])
+                start = end
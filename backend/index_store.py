@@ -0,0 +1,449 @@
+"""On-disk index format shared by build_index.py and the API.
+
+An index lives in ``data/index/<version>/``. The ``CURRENT`` file next to the
+version directories holds the version that readers should load.
+
+- ``manifest.json``: format number, version, counts, model (name and the
+  fingerprint of the backend settings that produced the vectors) and file list
+- ``clusters.json``: cluster summaries, labels and map bounds (small, JSON)
+- ``<name>.npy``: numeric arrays, opened with ``np.load(mmap_mode="r")``.
+  ``embedding_codes`` / ``embedding_scales`` are an optional int8 or float16
+  copy of the embeddings for the first search pass.
+- ``articles/``: one file set per metadata column. String columns are an
+  UTF-8 blob plus int64 offsets and a validity mask, like Arrow. Values are
+  cleaned (NaN -> null, dict-like headlines -> their main text) when written.
+- ``lexical/``: optional TF-IDF vocabulary and postings (see lexical_index.py)
+
+Versions are written to a temporary directory and renamed into place, and
+``CURRENT`` is swapped atomically, so a running server never sees half an
+index.
+"""
+import argparse
+import ast
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from cluster_index import membership_order, parse_pub_dates
+from config import DATA_DIR, EMBEDDING_QUANTIZATION, INDEX_DIR
+from search_filters import section_codes
+
+FORMAT_VERSION = 2
+# Format 1 stored article fields uncleaned; they are cleaned in memory on load.
+READABLE_FORMATS = (1, 2)
+LEGACY_INDEX_PATH = DATA_DIR / "index.pkl"
+
+ARRAY_FIELDS = (
+    "embeddings",
+    "coords_2d",
+    "coarse_ids",
+    "fine_ids",
+    "parent_fine_ids",
+    "coarse_centroids",
+    "fine_centroids",
+    "coarse_sums",
+    "fine_sums",
+    "coarse_order",
+    "coarse_offsets",
+    "fine_order",
+    "fine_offsets",
+    "pub_ts",
+    "embedding_codes",
+    "embedding_scales",
+    "date_order",
+    "section_codes",
+)
+ARTICLE_COLUMNS = ("headline", "abstract", "pub_date", "section", "byline", "url")
+CLUSTER_FIELDS = (
+    "coarse_clusters",
+    "fine_clusters",
+    "coarse_cluster_labels",
+    "fine_cluster_labels",
+    "map_bounds",
+)
+
+
+def clean_field(value) -> Optional[str]:
+    """Convert NaN / Nones to None, everything else to str."""
+    if value is None:
+        return None
+    if isinstance(value, float) and value != value:
+        return None
+    return str(value)
+
+
+def clean_headline(value) -> str:
+    """Headline sometimes comes as a dict-like structure from NYT metadata."""
+    # dict case
+    if isinstance(value, dict):
+        main = value.get("main") or value.get("print_headline") or ""
+        return str(main) if main is not None else ""
+
+    # string that looks like a dict with 'main'
+    if isinstance(value, str) and value.strip().startswith("{") and "main" in value:
+        try:
+            parsed = ast.literal_eval(value)
+            if isinstance(parsed, dict):
+                main = parsed.get("main") or parsed.get("print_headline") or ""
+                if main:
+                    return str(main)
+        except Exception:
+            pass
+
+    return clean_field(value) or ""
+
+
+def _cleaner(name: str):
+    return clean_headline if name == "headline" else clean_field
+
+
+class StringColumn:
+    """Read-only string column backed by memory-mapped offsets and bytes."""
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray, valid: np.ndarray):
+        self.offsets = offsets
+        self.data = data
+        self.valid = valid
+
+    @classmethod
+    def open(cls, base: Path):
+        offsets = np.load(f"{base}.offsets.npy", mmap_mode="r")
+        valid = np.load(f"{base}.valid.npy", mmap_mode="r")
+        data_path = Path(f"{base}.data")
+        if data_path.stat().st_size:
+            data = np.memmap(data_path, dtype=np.uint8, mode="r")
+        else:
+            data = np.zeros(0, dtype=np.uint8)
+        return cls(offsets, data, valid)
+
+    @staticmethod
+    def _encode(values: Iterable[Optional[str]]):
+        chunks = []
+        offsets = [0]
+        valid = []
+        pos = 0
+        for value in values:
+            valid.append(value is not None)
+            if value is not None:
+                encoded = value.encode("utf-8")
+                chunks.append(encoded)
+                pos += len(encoded)
+            offsets.append(pos)
+        return (
+            np.asarray(offsets, dtype=np.int64),
+            b"".join(chunks),
+            np.asarray(valid, dtype=bool),
+        )
+
+    @classmethod
+    def from_values(cls, values: Iterable[Optional[str]]):
+        """In-memory column, for indexes that predate cleaned columns."""
+        offsets, data, valid = cls._encode(values)
+        return cls(offsets, np.frombuffer(data, dtype=np.uint8), valid)
+
+    @classmethod
+    def write(cls, base: Path, values: Iterable[Optional[str]]):
+        offsets, data, valid = cls._encode(values)
+        with open(f"{base}.data", "wb") as fh:
+            fh.write(data)
+        np.save(f"{base}.offsets.npy", offsets)
+        np.save(f"{base}.valid.npy", valid)
+
+    def __len__(self) -> int:
+        return int(self.valid.shape[0])
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        if not self.valid[i]:
+            return None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.data[start:end].tobytes().decode("utf-8")
+
+    def take(self, rows: np.ndarray) -> List[Optional[str]]:
+        """Values for many rows at once; offsets and nulls are gathered vectorized."""
+        starts = self.offsets[rows].tolist()
+        ends = self.offsets[rows + 1].tolist()
+        valid = self.valid[rows].tolist()
+        data = self.data
+        return [
+            data[start:end].tobytes().decode("utf-8") if ok else None
+            for start, end, ok in zip(starts, ends, valid)
+        ]
+
+
+class ArticleTable:
+    """Column-wise article metadata; ``table[i]`` returns a dict per article."""
+
+    def __init__(self, ids: np.ndarray, columns: Dict[str, StringColumn]):
+        self.ids = ids
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return int(self.ids.shape[0])
+
+    def __getitem__(self, i: int) -> dict:
+        row = {"id": int(self.ids[i])}
+        for name, column in self.columns.items():
+            row[name] = column[i]
+        return row
+
+    def take(self, rows: np.ndarray) -> Dict[str, list]:
+        """Column name -> list of values for ``rows``, including ``id``."""
+        rows = np.asarray(rows, dtype=np.int64)
+        out = {"id": self.ids[rows].tolist()}
+        for name, column in self.columns.items():
+            out[name] = column.take(rows)
+        return out
+
+    @classmethod
+    def from_raw(cls, ids: np.ndarray, raw_columns: dict):
+        """Cleaned in-memory table from uncleaned values (legacy pickle, format 1)."""
+        columns = {}
+        for name in ARTICLE_COLUMNS:
+            clean = _cleaner(name)
+            raw = raw_columns.get(name)
+            columns[name] = StringColumn.from_values(
+                clean(raw[i]) if raw is not None else None for i in range(len(ids))
+            )
+        return cls(np.asarray(ids, dtype=np.int64), columns)
+
+
+def _write_json(path: Path, payload):
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(payload, fh, ensure_ascii=False)
+
+
+def _int_keys(mapping: dict) -> dict:
+    return {int(k): v for k, v in mapping.items()}
+
+
+def current_version(root: Path = INDEX_DIR) -> Optional[str]:
+    try:
+        return (root / "CURRENT").read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _set_current(root: Path, version: str):
+    tmp = root / f".CURRENT.{os.getpid()}"
+    tmp.write_text(version, encoding="utf-8")
+    os.replace(tmp, root / "CURRENT")
+
+
+def _prune(root: Path, keep: int):
+    current = current_version(root)
+    versions = sorted(p for p in root.iterdir() if p.is_dir() and not p.name.startswith("."))
+    for path in versions[:-keep] if keep > 0 else []:
+        if path.name != current:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _add_derived_arrays(index: dict, articles):
+    """Lookup structures the API would otherwise rebuild on every start."""
+    from vector_index import cluster_sums, normalize_rows, quantize
+
+    if index.get("pub_ts") is None and "pub_date" in articles.columns:
+        index["pub_ts"] = parse_pub_dates(articles["pub_date"])
+    for level in ("coarse", "fine"):
+        if index.get(f"{level}_sums") is None:
+            # Raw member sums let update_index.py keep centroids an exact mean.
+            assignments = np.asarray(index[f"{level}_ids"])
+            n_clusters = max(len(index[f"{level}_clusters"]), int(assignments.max()) + 1)
+            index[f"{level}_sums"] = cluster_sums(index["embeddings"], assignments, n_clusters)
+        if index.get(f"{level}_centroids") is None:
+            # Legacy pickles have no centroids; the normalized member mean is one.
+            index[f"{level}_centroids"] = normalize_rows(index[f"{level}_sums"])
+        centroids = index[f"{level}_centroids"]
+        if index.get(f"{level}_order") is None:
+            order, offsets = membership_order(
+                index["embeddings"], index[f"{level}_ids"], centroids
+            )
+            index[f"{level}_order"] = order
+            index[f"{level}_offsets"] = offsets
+    if index.get("date_order") is None and index.get("pub_ts") is not None:
+        index["date_order"] = np.argsort(index["pub_ts"], kind="stable")
+    if index.get("section_codes") is None and "section" in articles.columns:
+        codes, names = section_codes(map(_cleaner("section"), articles["section"]))
+        index["section_codes"] = codes
+        index["section_names"] = names
+    if index.get("embedding_codes") is None and EMBEDDING_QUANTIZATION:
+        codes, scales = quantize(index["embeddings"], EMBEDDING_QUANTIZATION)
+        index["embedding_codes"] = codes
+        index["embedding_scales"] = scales
+
+
+def write_index(
+    index: dict,
+    articles,
+    root: Path = INDEX_DIR,
+    model_name: Optional[str] = None,
+    keep: int = 3,
+    model_fingerprint: Optional[str] = None,
+) -> Path:
+    """Write a new index version and point ``CURRENT`` at it.
+
+    ``index`` holds the arrays and cluster metadata (see ``ARRAY_FIELDS`` and
+    ``CLUSTER_FIELDS``); ``articles`` is a DataFrame with an ``id`` column and
+    any of ``ARTICLE_COLUMNS``.
+    """
+    root.mkdir(parents=True, exist_ok=True)
+    version = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+    while (root / version).exists():
+        time.sleep(1)
+        version = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+    tmp_dir = root / f".tmp-{version}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    (tmp_dir / "articles").mkdir(parents=True)
+
+    index = dict(index)
+    _add_derived_arrays(index, articles)
+    arrays = {}
+    for name in ARRAY_FIELDS:
+        if index.get(name) is None:
+            continue
+        array = np.ascontiguousarray(index[name])
+        np.save(tmp_dir / f"{name}.npy", array)
+        arrays[name] = {"dtype": str(array.dtype), "shape": list(array.shape)}
+
+    np.save(tmp_dir / "articles" / "id.npy", articles["id"].to_numpy(dtype=np.int64))
+    columns = []
+    for name in ARTICLE_COLUMNS:
+        values = articles[name] if name in articles.columns else [None] * len(articles)
+        StringColumn.write(tmp_dir / "articles" / name, map(_cleaner(name), values))
+        columns.append(name)
+
+    _write_json(tmp_dir / "clusters.json", {name: index[name] for name in CLUSTER_FIELDS})
+    if index.get("lexical") is not None:
+        index["lexical"].write(tmp_dir / "lexical")
+    manifest = {
+        "format": FORMAT_VERSION,
+        "version": version,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "embedding_model": model_name,
+        "embedding_fingerprint": model_fingerprint,
+        "article_count": int(len(articles)),
+        "coarse_cluster_count": len(index["coarse_clusters"]),
+        "fine_cluster_count": len(index["fine_clusters"]),
+        "arrays": arrays,
+        "article_columns": columns,
+        "lexical": index.get("lexical") is not None,
+        "section_names": index.get("section_names"),
+    }
+    _write_json(tmp_dir / "manifest.json", manifest)
+
+    final_dir = root / version
+    os.replace(tmp_dir, final_dir)
+    _set_current(root, version)
+    _prune(root, keep)
+    return final_dir
+
+
+def _load_legacy(path: Path) -> dict:
+    import joblib
+
+    from vector_index import normalize_rows
+
+    index = joblib.load(path)
+    records = index["articles"]
+    index["articles"] = ArticleTable.from_raw(
+        [int(art["id"]) for art in records],
+        {name: [art.get(name) for art in records] for name in ARTICLE_COLUMNS},
+    )
+    index["embeddings"] = normalize_rows(index["embeddings"])
+    stat = path.stat()
+    index["version"] = f"legacy-{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    return index
+
+
+def read_manifest(root: Path = INDEX_DIR, version: Optional[str] = None) -> Optional[dict]:
+    """The manifest of ``version`` (default: ``CURRENT``), or None if there is none."""
+    version = version or current_version(root)
+    if version is None:
+        return None
+    with open(root / version / "manifest.json", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def load_index(root: Path = INDEX_DIR, version: Optional[str] = None) -> dict:
+    """Open an index version (default: ``CURRENT``) with arrays memory-mapped.
+
+    Returns the same keys the old pickle had, plus ``version`` and
+    ``manifest``. Falls back to ``data/index.pkl`` if no versioned index
+    exists yet.
+    """
+    version = version or current_version(root)
+    if version is None:
+        if LEGACY_INDEX_PATH.exists():
+            print(
+                f"Loading legacy {LEGACY_INDEX_PATH.name}; run "
+                "`python index_store.py --convert` to switch to the mmap format."
+            )
+            return _load_legacy(LEGACY_INDEX_PATH)
+        raise FileNotFoundError(f"No index found in {root}; run build_index.py first.")
+
+    path = root / version
+    manifest = read_manifest(root, version)
+    if manifest.get("format") not in READABLE_FORMATS:
+        raise ValueError(
+            f"Index {version} has format {manifest.get('format')}, expected {FORMAT_VERSION}."
+        )
+    with open(path / "clusters.json", encoding="utf-8") as fh:
+        clusters = json.load(fh)
+
+    index = {"version": version, "manifest": manifest}
+    for name in manifest["arrays"]:
+        index[name] = np.load(path / f"{name}.npy", mmap_mode="r")
+    ids = np.load(path / "articles" / "id.npy", mmap_mode="r")
+    columns = {
+        name: StringColumn.open(path / "articles" / name)
+        for name in manifest["article_columns"]
+    }
+    if manifest["format"] == 1:
+        index["articles"] = ArticleTable.from_raw(ids, columns)
+    else:
+        index["articles"] = ArticleTable(ids, columns)
+    index.update(clusters)
+    if manifest.get("lexical"):
+        from lexical_index import LexicalIndex
+
+        index["lexical"] = LexicalIndex.open(path / "lexical")
+    index["coarse_cluster_labels"] = _int_keys(clusters["coarse_cluster_labels"])
+    index["fine_cluster_labels"] = _int_keys(clusters["fine_cluster_labels"])
+    return index
+
+
+def convert_legacy(path: Path = LEGACY_INDEX_PATH, root: Path = INDEX_DIR) -> Path:
+    import pandas as pd
+
+    index = _load_legacy(path)
+    table = index["articles"]
+    rows = np.arange(len(table))
+    articles = pd.DataFrame(table.take(rows))
+    return write_index(index, articles, root=root)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or convert the on-disk index.")
+    parser.add_argument(
+        "--convert",
+        action="store_true",
+        help=f"convert {LEGACY_INDEX_PATH.name} into a new index version",
+    )
+    args = parser.parse_args()
+    if args.convert:
+        print(f"Wrote {convert_legacy()}")
+        return
+    version = current_version()
+    if version is None:
+        print(f"No index version in {INDEX_DIR}")
+        return
+    with open(INDEX_DIR / version / "manifest.json", encoding="utf-8") as fh:
+        print(json.dumps(json.load(fh), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""AI cluster labels: the labeling stage and the persistent label store.
+
+``label_clusters`` runs the OpenAI requests for a list of clusters on a small
+thread pool, with retries, a request budget and an on-disk cache keyed by a
+hash of (labeler model, level, sample headlines), so rebuilds only pay for
+clusters whose content changed. ``build_index.py`` and the API both use it.
+
+The API applies labels from ``data/cluster_labels.json``, keyed by
+``<level>:<cluster id>`` plus a hash of the sample headlines, and only while
+that hash still matches. Relabeling is an explicit step:
+
+    python labels.py            # label clusters without a current entry
+    python labels.py --force    # relabel everything
+    python labels.py --stub     # time the stage offline with a fake client
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import DATA_DIR, LABEL_REQUEST_BUDGET, LABEL_WORKERS
+
+LABEL_STORE_PATH = DATA_DIR / "cluster_labels.json"
+LABEL_CACHE_PATH = DATA_DIR / "label_cache.json"
+LEVEL_NAMES = {"coarse": "broad topic", "fine": "subtopic"}
+
+LabelJob = Tuple[str, int, str, List[str]]
+
+
+def sample_hash(level: str, samples: List[str]) -> str:
+    payload = level + "\n" + "\n".join(samples)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _write_json_atomic(path: Path, payload):
+    tmp = path.with_suffix(f".tmp{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(payload, fh, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _read_json(path: Path) -> dict:
+    if not path.exists():
+        return {}
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+class LabelStore:
+    def __init__(self, path: Path = LABEL_STORE_PATH):
+        self.path = path
+        self.entries = _read_json(path)
+
+    def get(self, level: str, cid: int, digest: str) -> Optional[str]:
+        entry = self.entries.get(f"{level}:{cid}")
+        if entry and entry.get("hash") == digest:
+            return entry.get("label")
+        return None
+
+    def set(self, level: str, cid: int, digest: str, label: str):
+        self.entries[f"{level}:{cid}"] = {"hash": digest, "label": label}
+
+    def save(self):
+        _write_json_atomic(self.path, self.entries)
+
+
+class LabelCache:
+    """Content-addressed label cache shared by every build."""
+
+    def __init__(self, path: Path = LABEL_CACHE_PATH):
+        self.path = path
+        self.entries = _read_json(path)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(level: str, samples: List[str], labeler: str) -> str:
+        """Keyed by content and by who labeled it, not by the current label,
+        so the build (TF-IDF names) and the API (stored names) share entries."""
+        payload = "\n".join([labeler, level, *samples])
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        return self.entries.get(key)
+
+    def set(self, key: str, label: str):
+        with self._lock:
+            self.entries[key] = label
+
+    def save(self):
+        with self._lock:
+            _write_json_atomic(self.path, dict(self.entries))
+
+
+class OpenAILabeler:
+    cacheable = True
+
+    def __init__(self, client, model: str = "gpt-4o-mini"):
+        self.client = client
+        self.model = model
+        self.identity = f"openai:{model}"
+        self.name = f"OpenAI ({model})"
+
+    def complete(self, prompt: str) -> str:
+        response = self.client.responses.create(model=self.model, input=prompt)
+        return (response.output_text or "").strip()
+
+
+class StubLabeler:
+    """Offline stand-in: echoes the default label after a fixed delay.
+
+    Its labels are never written to the label cache or the label store.
+    """
+
+    cacheable = False
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.identity = "stub"
+        self.name = "the stub labeler"
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def complete(self, prompt: str) -> str:
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        existing = prompt.rsplit("Existing label: ", 1)[-1].split("\n", 1)[0]
+        return f"{existing.title()} (stub)"
+
+
+def make_labeler(openai_client=None):
+    """Labeler picked by LABEL_CLIENT (openai|stub|none); None disables AI naming."""
+    choice = os.getenv("LABEL_CLIENT", "openai").lower()
+    if choice == "stub":
+        return StubLabeler(float(os.getenv("LABEL_STUB_LATENCY", "0")))
+    if choice == "openai" and openai_client is not None:
+        return OpenAILabeler(openai_client)
+    return None
+
+
+def label_prompt(default_label: str, samples: List[str], level: str) -> str:
+    return (
+        "You rename clusters inside a knowledge map built from New York Times articles.\n"
+        f"Provide a concise {LEVEL_NAMES[level]} label (max 4 words, Title Case) "
+        "based on these sample headlines:\n"
+        + "\n".join(f"- {s}" for s in samples)
+        + f"\nExisting label: {default_label}\nReturn only the improved label."
+    )
+
+
+def label_clusters(
+    jobs: Iterable[LabelJob],
+    labeler,
+    cache: Optional[LabelCache] = None,
+    workers: int = LABEL_WORKERS,
+    budget: Optional[int] = LABEL_REQUEST_BUDGET,
+    retries: int = 3,
+    backoff: float = 1.0,
+    refresh: bool = False,
+):
+    """Label clusters concurrently; returns ``({(level, cid): label}, stats)``.
+
+    Cache hits are free (``refresh`` skips the lookup but still stores the new
+    labels). At most ``budget`` requests reach the labeler, counting every
+    retry. Jobs over budget, and any that still fail after ``retries`` attempts
+    with exponential backoff, are left out of the result so callers keep their
+    default label (and can try again next time). Labelers that are not
+    ``cacheable`` bypass the cache.
+    """
+    jobs = list(jobs)
+    if not getattr(labeler, "cacheable", True):
+        cache = None
+    identity = getattr(labeler, "identity", type(labeler).__name__)
+    labels: Dict[Tuple[str, int], str] = {}
+    stats = {"cached": 0, "requested": 0, "attempts": 0, "failed": 0, "over_budget": 0}
+    pending = []
+    for job in jobs:
+        level, cid, default_label, samples = job
+        key = LabelCache.key(level, samples, identity)
+        hit = cache.get(key) if cache is not None and not refresh else None
+        if hit:
+            labels[(level, cid)] = hit
+            stats["cached"] += 1
+        elif budget is not None and len(pending) >= budget:
+            stats["over_budget"] += 1
+        else:
+            pending.append((key, job))
+
+    spent = [0]
+    spent_lock = threading.Lock()
+
+    def charge() -> bool:
+        with spent_lock:
+            if budget is not None and spent[0] >= budget:
+                return False
+            spent[0] += 1
+            return True
+
+    def run(item):
+        key, (level, cid, default_label, samples) = item
+        prompt = label_prompt(default_label, samples, level)
+        for attempt in range(retries):
+            if not charge():
+                break
+            try:
+                text = labeler.complete(prompt)[:80]
+                if text:
+                    return key, level, cid, text
+            except Exception:
+                pass
+            if attempt + 1 < retries:
+                time.sleep(backoff * (2**attempt))
+        return key, level, cid, None
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for key, level, cid, label in pool.map(run, pending):
+                stats["requested"] += 1
+                if label is None:
+                    stats["failed"] += 1
+                    continue
+                labels[(level, cid)] = label
+                if cache is not None:
+                    cache.set(key, label)
+        if cache is not None:
+            cache.save()
+    stats["attempts"] = spent[0]
+    return labels, stats
+
+
+def cluster_samples(articles, idxs, limit: int = 5) -> List[str]:
+    samples = []
+    for i in idxs:
+        headline = articles[i].get("headline")
+        if headline:
+            samples.append(headline)
+        if len(samples) >= limit:
+            break
+    return samples
+
+
+def label_jobs(
+    articles, coarse_clusters, fine_clusters, coarse_members, fine_members
+) -> List[LabelJob]:
+    """(level, cluster id, current label, sample headlines) for every cluster."""
+    jobs = []
+    for level, clusters, members in (
+        ("coarse", coarse_clusters, coarse_members),
+        ("fine", fine_clusters, fine_members),
+    ):
+        for cluster in clusters:
+            cid = cluster["id"]
+            samples = cluster_samples(articles, members.members(cid))
+            if samples:
+                jobs.append((level, cid, cluster["label"], samples))
+    return jobs
+
+
+def stored_labels(store: LabelStore, jobs: Iterable[LabelJob]) -> dict:
+    """{(level, cid): label} for clusters whose stored label is still current."""
+    found = {}
+    for level, cid, _, samples in jobs:
+        label = store.get(level, cid, sample_hash(level, samples))
+        if label:
+            found[(level, cid)] = label
+    return found
+
+
+def relabel(
+    store: LabelStore,
+    labeler,
+    jobs: Iterable[LabelJob],
+    force: bool = False,
+    cache: Optional[LabelCache] = None,
+):
+    """Label every cluster without a current stored label and save the store.
+
+    ``force`` relabels every cluster and ignores cached labels. Labels from a
+    labeler that is not ``cacheable`` are applied to ``store`` in memory only.
+    """
+    todo = [
+        job
+        for job in jobs
+        if force or not store.get(job[0], job[1], sample_hash(job[0], job[3]))
+    ]
+    labels, stats = label_clusters(todo, labeler, cache=cache, refresh=force)
+    for level, cid, _, samples in todo:
+        if (level, cid) in labels:
+            store.set(level, cid, sample_hash(level, samples), labels[(level, cid)])
+    if getattr(labeler, "cacheable", True):
+        store.save()
+    return stats
+
+
+def main():
+    from dotenv import load_dotenv
+    from openai import OpenAI
+
+    from cluster_index import load_membership
+    from index_store import load_index
+
+    parser = argparse.ArgumentParser(description="Generate and store AI cluster labels.")
+    parser.add_argument("--force", action="store_true", help="relabel every cluster")
+    parser.add_argument(
+        "--stub",
+        type=float,
+        metavar="LATENCY",
+        help="benchmark with a fake client of this latency (seconds); nothing is saved",
+    )
+    parser.add_argument("--workers", type=int, default=LABEL_WORKERS)
+    args = parser.parse_args()
+
+    index = load_index()
+    jobs = label_jobs(
+        index["articles"],
+        index["coarse_clusters"],
+        index["fine_clusters"],
+        load_membership(index, "coarse"),
+        load_membership(index, "fine"),
+    )
+
+    if args.stub is not None:
+        start = time.perf_counter()
+        _, stats = label_clusters(
+            jobs, StubLabeler(args.stub), workers=args.workers, budget=None
+        )
+        elapsed = time.perf_counter() - start
+        print(f"{len(jobs)} clusters, {args.workers} workers: {elapsed:.2f}s {stats}")
+        return
+
+    load_dotenv()
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise SystemExit("OPENAI_API_KEY is not set.")
+    store = LabelStore()
+    stats = relabel(
+        store, OpenAILabeler(OpenAI(api_key=api_key)), jobs, force=args.force, cache=LabelCache()
+    )
+    print(f"Labeled clusters {stats}; saved to {store.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""2D map layout for the article embeddings.
+
+``exact`` runs t-SNE on every article, which is fine up to a few tens of
+thousands of points. ``landmark`` runs t-SNE on a sample stratified by fine
+cluster and places every other article at the weighted mean of its nearest
+landmarks, so its cost grows linearly with corpus size. Compare the two on the
+current index with:
+
+    python layout.py --mode exact landmark
+"""
+import argparse
+import time
+
+import numpy as np
+from sklearn.manifold import TSNE
+
+from config import LAYOUT_EXACT_MAX, LAYOUT_LANDMARKS, LAYOUT_MODE, TSNE_PERPLEXITY
+
+
+def block_rows(n_cols: int, memory_budget: int, bytes_per_cell: int = 40) -> int:
+    """Rows per block so ``rows x n_cols`` working arrays fit in ``memory_budget`` bytes."""
+    return max(1, int(memory_budget // (max(n_cols, 1) * bytes_per_cell)))
+
+
+def interpolate_coords(neighbors: np.ndarray, sims: np.ndarray, ref_coords: np.ndarray):
+    """Similarity-weighted mean of the neighbors' map coordinates, per row."""
+    # Sharpen toward the closest neighbors; clip so negatives do not pull.
+    weights = np.clip(np.asarray(sims, dtype=np.float32), 1e-6, None) ** 4
+    weights /= weights.sum(axis=1, keepdims=True)
+    return np.einsum("ij,ijd->id", weights, np.asarray(ref_coords)[neighbors])
+
+
+def place_by_neighbors(
+    ref_embeddings: np.ndarray,
+    ref_coords: np.ndarray,
+    new_embeddings: np.ndarray,
+    k: int = 10,
+    memory_budget: int = 256 << 20,
+) -> np.ndarray:
+    """2D positions for new points from their k nearest already-placed neighbors.
+
+    Each point lands at the similarity-weighted mean of its neighbors' map
+    coordinates. Neighbors come from an exact scan, one matmul per batch of
+    new points, with batches sized to ``memory_budget``; use it against a
+    bounded reference set such as the layout landmarks.
+    """
+    new_embeddings = np.asarray(new_embeddings, dtype=np.float32)
+    ref_embeddings = np.asarray(ref_embeddings)
+    k = min(k, ref_embeddings.shape[0])
+    # sims (float32) plus the argpartition output (int64) per cell
+    batch_size = block_rows(ref_embeddings.shape[0], memory_budget, bytes_per_cell=16)
+    out = np.empty((new_embeddings.shape[0], 2), dtype=np.float32)
+    for start in range(0, new_embeddings.shape[0], batch_size):
+        block = new_embeddings[start : start + batch_size]
+        sims = block @ ref_embeddings.T
+        nn = np.argpartition(sims, -k, axis=1)[:, -k:]
+        out[start : start + block.shape[0]] = interpolate_coords(
+            nn, np.take_along_axis(sims, nn, axis=1), ref_coords
+        )
+    return out
+
+
+def place_by_search(
+    search_index, ref_coords: np.ndarray, new_embeddings: np.ndarray, k: int = 10,
+    batch_size: int = 1024,
+) -> np.ndarray:
+    """``place_by_neighbors`` with neighbors from a ``VectorIndex``, so a large
+    corpus is searched through its IVF lists instead of scanned in full."""
+    new_embeddings = np.asarray(new_embeddings, dtype=np.float32)
+    k = min(k, search_index.size)
+    out = np.empty((new_embeddings.shape[0], 2), dtype=np.float32)
+    for start in range(0, new_embeddings.shape[0], batch_size):
+        block = new_embeddings[start : start + batch_size]
+        found = search_index.search_batch(block, [k] * len(block))
+        neighbors = np.stack([idx for idx, _ in found])
+        sims = np.stack([scores for _, scores in found])
+        out[start : start + block.shape[0]] = interpolate_coords(neighbors, sims, ref_coords)
+    return out
+
+
+def tsne_layout(embeddings: np.ndarray, perplexity: float = TSNE_PERPLEXITY) -> np.ndarray:
+    tsne = TSNE(
+        n_components=2,
+        perplexity=min(perplexity, len(embeddings) - 1),
+        random_state=42,
+        init="random",
+        learning_rate="auto",
+    )
+    return tsne.fit_transform(embeddings).astype(np.float32)
+
+
+def stratified_landmarks(fine_ids: np.ndarray, n_landmarks: int, seed: int = 42) -> np.ndarray:
+    """Sorted row indices, allocated to fine clusters by size (at least one each)."""
+    n = len(fine_ids)
+    if n_landmarks >= n:
+        return np.arange(n)
+    rng = np.random.default_rng(seed)
+    counts = np.bincount(fine_ids)
+    quota = np.minimum(counts, np.maximum(1, np.round(counts * n_landmarks / n)).astype(int))
+    # One random permutation, stably grouped by cluster; take each group's head.
+    perm = rng.permutation(n)
+    perm = perm[np.argsort(fine_ids[perm], kind="stable")]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.arange(n) - np.repeat(starts, counts)
+    return np.sort(perm[rank < np.repeat(quota, counts)])
+
+
+def landmark_layout(
+    embeddings: np.ndarray,
+    fine_ids: np.ndarray,
+    n_landmarks: int = LAYOUT_LANDMARKS,
+    perplexity: float = TSNE_PERPLEXITY,
+    k: int = 10,
+    timings: dict = None,
+) -> np.ndarray:
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+    landmarks = stratified_landmarks(np.asarray(fine_ids), n_landmarks)
+    rest = np.setdiff1d(np.arange(len(embeddings)), landmarks, assume_unique=True)
+    timings["sample"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    coords = np.empty((len(embeddings), 2), dtype=np.float32)
+    coords[landmarks] = tsne_layout(embeddings[landmarks], perplexity)
+    timings["tsne"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if len(rest):
+        coords[rest] = place_by_neighbors(
+            embeddings[landmarks], coords[landmarks], embeddings[rest], k=k
+        )
+    timings["interpolate"] = time.perf_counter() - start
+    return coords
+
+
+def neighborhood_preservation(
+    embeddings: np.ndarray,
+    coords: np.ndarray,
+    k: int = 10,
+    sample: int = 2000,
+    reference: int = 20000,
+    seed: int = 0,
+    memory_budget: int = 256 << 20,
+) -> float:
+    """Mean share of each point's k nearest embedding neighbors that stay among
+    its k nearest map neighbors, over a random sample of points.
+
+    Neighbors are looked up within a random ``reference`` subset that contains
+    the sampled points, so the cost does not grow with corpus size. Query
+    blocks are sized to keep the similarity, distance and argpartition arrays
+    within ``memory_budget`` bytes.
+    """
+    n = len(embeddings)
+    rng = np.random.default_rng(seed)
+    ref = np.sort(rng.choice(n, size=min(reference, n), replace=False))
+    k = min(k, len(ref) - 1)
+    queries = rng.choice(len(ref), size=min(sample, len(ref)), replace=False)
+    ref_embeddings = np.asarray(embeddings[ref], dtype=np.float32)
+    ref_coords = np.asarray(coords, dtype=np.float32)[ref]
+    sq_norms = (ref_coords**2).sum(axis=1)
+    step = block_rows(len(ref), memory_budget)
+    total = 0.0
+    for start in range(0, len(queries), step):
+        q = queries[start : start + step]
+        rows = np.arange(len(q))
+        sims = ref_embeddings[q] @ ref_embeddings.T
+        sims[rows, q] = -np.inf
+        high = np.argpartition(sims, -k, axis=1)[:, -k:]
+        del sims
+        dists = sq_norms[q, None] + sq_norms[None, :] - 2 * ref_coords[q] @ ref_coords.T
+        dists[rows, q] = np.inf
+        low = np.argpartition(dists, k - 1, axis=1)[:, :k]
+        del dists
+        for a, b in zip(high, low):
+            total += len(np.intersect1d(a, b, assume_unique=True)) / k
+    return total / len(queries)
+
+
+def compute_layout(embeddings, fine_ids, mode: str = LAYOUT_MODE, score: bool = True):
+    """Map coordinates plus a report of the mode used, stage timings and score."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if mode == "auto":
+        mode = "landmark" if len(embeddings) > LAYOUT_EXACT_MAX else "exact"
+    timings = {}
+    start = time.perf_counter()
+    if mode == "exact":
+        coords = tsne_layout(embeddings)
+        timings["tsne"] = time.perf_counter() - start
+    elif mode == "landmark":
+        coords = landmark_layout(embeddings, fine_ids, timings=timings)
+    else:
+        raise ValueError(f"Unknown layout mode: {mode}")
+    timings["total"] = time.perf_counter() - start
+
+    report = {"mode": mode, "timings": {k: round(v, 2) for k, v in timings.items()}}
+    if score:
+        report["neighborhood_preservation@10"] = round(
+            neighborhood_preservation(embeddings, coords), 4
+        )
+    print(f"Layout: {report}")
+    return coords, report
+
+
+def main():
+    from index_store import load_index
+
+    parser = argparse.ArgumentParser(description="Compare map layout modes on the current index.")
+    parser.add_argument("--mode", nargs="+", default=["exact", "landmark"])
+    args = parser.parse_args()
+
+    index = load_index()
+    for mode in args.mode:
+        compute_layout(index["embeddings"], index["fine_ids"], mode=mode)
+
+
+if __name__ == "__main__":
+    main()
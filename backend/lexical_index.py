@@ -0,0 +1,134 @@
+"""Keyword search over the TF-IDF vocabulary fitted by build_index.py.
+
+The index directory gets a ``lexical/`` folder holding the vocabulary and idf
+weights plus the document-term matrix transposed into postings (CSR rows are
+terms, columns are article rows, values the documents' normalized TF-IDF
+weights). A query is vectorized with the same analyzer and idf, and only the
+postings of its terms are touched, so scoring cost follows how common the
+query terms are rather than corpus size.
+"""
+import json
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from vector_index import top_k
+
+
+class LexicalIndex:
+    def __init__(self, terms: List[str], idf: np.ndarray, postings: sparse.csr_matrix, params: dict):
+        self.terms = list(terms)
+        self.vocabulary = {term: col for col, term in enumerate(self.terms)}
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.postings = postings
+        self.params = params
+        self.analyzer = TfidfVectorizer(
+            ngram_range=tuple(params["ngram_range"]),
+            stop_words=params["stop_words"],
+            lowercase=params.get("lowercase", True),
+        ).build_analyzer()
+
+    @property
+    def size(self) -> int:
+        return int(self.postings.shape[1])
+
+    @classmethod
+    def from_vectorizer(cls, vectorizer: TfidfVectorizer, doc_term: sparse.spmatrix):
+        """Postings from a fitted (l2-normalized, raw tf) vectorizer and its output."""
+        params = {
+            "ngram_range": list(vectorizer.ngram_range),
+            "stop_words": vectorizer.stop_words,
+            "lowercase": vectorizer.lowercase,
+        }
+        postings = sparse.csr_matrix(doc_term.T, dtype=np.float32)
+        return cls(vectorizer.get_feature_names_out(), vectorizer.idf_, postings, params)
+
+    def vectorize(self, texts: Iterable[str]) -> sparse.csr_matrix:
+        """TF-IDF rows for ``texts`` with the stored vocabulary and idf, like
+        ``TfidfVectorizer.transform``."""
+        indptr, indices, data = [0], [], []
+        for text in texts:
+            cols = [self.vocabulary[t] for t in self.analyzer(text) if t in self.vocabulary]
+            uniq, counts = np.unique(np.asarray(cols, dtype=np.int64), return_counts=True)
+            weights = counts * self.idf[uniq]
+            norm = np.linalg.norm(weights)
+            indices.append(uniq)
+            data.append(weights / norm if norm else weights)
+            indptr.append(indptr[-1] + len(uniq))
+        return sparse.csr_matrix(
+            (
+                np.concatenate(data) if data else np.empty(0),
+                np.concatenate(indices) if indices else np.empty(0, dtype=np.int64),
+                np.asarray(indptr),
+            ),
+            shape=(len(indptr) - 1, len(self.terms)),
+            dtype=np.float32,
+        )
+
+    def scores(self, text: str):
+        """``(rows, scores)``: cosine similarity for every article sharing a term."""
+        query = self.vectorize([text])
+        if not query.nnz:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows = []
+        weights = []
+        for col, q_weight in zip(query.indices, query.data):
+            start, end = self.postings.indptr[col], self.postings.indptr[col + 1]
+            rows.append(self.postings.indices[start:end])
+            weights.append(self.postings.data[start:end] * q_weight)
+        rows, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        return rows, np.bincount(inverse, weights=np.concatenate(weights)).astype(np.float32)
+
+    def search(self, text: str, k: int, allowed: Optional[np.ndarray] = None):
+        """Top-k ``(indices, scores)`` by TF-IDF cosine, best first, optionally
+        only among the sorted rows ``allowed``."""
+        rows, scores = self.scores(text)
+        if allowed is not None:
+            keep = np.isin(rows, allowed, assume_unique=True)
+            rows, scores = rows[keep], scores[keep]
+        best = top_k(scores, k)
+        return rows[best], scores[best]
+
+    def extend(self, texts: Iterable[str]) -> "LexicalIndex":
+        """A new index with ``texts`` appended as articles (idf is not refitted)."""
+        postings = sparse.hstack([self.postings, self.vectorize(texts).T], format="csr")
+        return LexicalIndex(self.terms, self.idf, postings, self.params)
+
+    def write(self, path: Path):
+        path.mkdir(parents=True, exist_ok=True)
+        with open(path / "params.json", "w", encoding="utf-8") as fh:
+            json.dump({**self.params, "terms": self.terms}, fh, ensure_ascii=False)
+        np.save(path / "idf.npy", self.idf)
+        np.save(path / "indptr.npy", self.postings.indptr.astype(np.int64))
+        np.save(path / "indices.npy", self.postings.indices.astype(np.int32))
+        np.save(path / "data.npy", self.postings.data.astype(np.float32))
+        np.save(path / "shape.npy", np.asarray(self.postings.shape, dtype=np.int64))
+
+    @classmethod
+    def open(cls, path: Path) -> "LexicalIndex":
+        with open(path / "params.json", encoding="utf-8") as fh:
+            params = json.load(fh)
+        terms = params.pop("terms")
+        postings = sparse.csr_matrix(
+            (
+                np.load(path / "data.npy", mmap_mode="r"),
+                np.load(path / "indices.npy", mmap_mode="r"),
+                np.load(path / "indptr.npy", mmap_mode="r"),
+            ),
+            shape=tuple(np.load(path / "shape.npy")),
+        )
+        return cls(terms, np.load(path / "idf.npy"), postings, params)
+
+
+def reciprocal_rank_fusion(rankings: List[np.ndarray], k: int, c: int = 60) -> np.ndarray:
+    """Fuse ranked id lists by sum of 1 / (c + rank); returns the top-k ids."""
+    ids = np.concatenate(rankings)
+    if not len(ids):
+        return ids
+    ranks = np.concatenate([np.arange(len(r)) for r in rankings])
+    uniq, inverse = np.unique(ids, return_inverse=True)
+    fused = np.bincount(inverse, weights=1.0 / (c + 1 + ranks))
+    return uniq[top_k(fused, k)]
@@ -0,0 +1,151 @@
+"""Per-client rate limits for the API (GCRA).
+
+The generic cell rate algorithm keeps one float per key, the "theoretical
+arrival time" (TAT) of the next request. A limit of ``limit`` requests per
+``window`` seconds spaces requests ``window / limit`` apart and tolerates a
+burst of ``limit``. A request is allowed if pushing the TAT forward by one
+interval keeps it within ``window`` of now.
+
+A key whose TAT is in the past is indistinguishable from a key never seen, so
+idle clients can be dropped without changing any decision. ``MemoryLimiter``
+uses this to stay bounded: an LRU of at most ``max_keys`` keys whose
+least-recently used entries are dropped once idle (checked every 1024
+requests, or right away when the LRU is full). ``SQLiteLimiter`` keeps the
+same state in a local SQLite file so every uvicorn worker on the host shares
+one set of counters.
+
+``python rate_limiter.py`` times a check on each backend.
+"""
+import argparse
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+
+class MemoryLimiter:
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max(1, max_keys)
+        self._tat: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+
+    def hit(self, key: str, limit: int, window: float, now: Optional[float] = None) -> float:
+        """Record a request; 0.0 if allowed, otherwise seconds until it would be."""
+        now = time.monotonic() if now is None else now
+        interval = window / limit
+        with self._lock:
+            tat = self._tat.get(key, now)
+            if tat < now:
+                tat = now
+            tat += interval
+            if tat - now > window:
+                return tat - now - window
+            self._tat[key] = tat
+            self._tat.move_to_end(key)
+            self._hits += 1
+            if len(self._tat) > self.max_keys or not self._hits & 1023:
+                self._evict(now)
+        return 0.0
+
+    def _evict(self, now: float):
+        # The front of the LRU is the longest idle; stop at the first live key.
+        tats = self._tat
+        while tats:
+            key = next(iter(tats))
+            if tats[key] > now and len(tats) <= self.max_keys:
+                break
+            del tats[key]
+
+    def __len__(self) -> int:
+        return len(self._tat)
+
+
+class SQLiteLimiter:
+    """GCRA state in a SQLite table shared by every process using ``path``.
+
+    Times are wall-clock (``time.time``) so they agree across processes. Idle
+    rows are deleted every ``prune_every`` checks.
+    """
+
+    def __init__(self, path: Path, prune_every: int = 1000):
+        self.path = str(path)
+        self.prune_every = prune_every
+        self._local = threading.local()
+        self._checks = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, tat REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def hit(self, key: str, limit: int, window: float, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        interval = window / limit
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tat FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            tat = max(row[0] if row else now, now) + interval
+            wait = max(0.0, tat - now - window)
+            if not wait:
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_limits (key, tat) VALUES (?, ?)", (key, tat)
+                )
+                self._checks += 1
+                if self._checks % self.prune_every == 0:
+                    conn.execute("DELETE FROM rate_limits WHERE tat < ?", (now,))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return wait
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM rate_limits").fetchone()[0]
+
+
+def make_limiter(backend: str = "memory", max_keys: int = 100_000):
+    """``memory`` (per process) or ``sqlite:<path>`` (shared by all workers on the host)."""
+    if backend == "memory":
+        return MemoryLimiter(max_keys)
+    if backend.startswith("sqlite:"):
+        return SQLiteLimiter(Path(backend[len("sqlite:"):]))
+    raise ValueError(f"Unknown rate limit backend: {backend}")
+
+
+def _time_checks(limiter, n: int, keys: int) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        limiter.hit(f"search:10.0.{i % keys}", limit=1_000_000, window=60)
+    return (time.perf_counter() - start) / n
+
+
+def main():
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Time rate limit checks per backend.")
+    parser.add_argument("-n", type=int, default=200_000)
+    parser.add_argument("--keys", type=int, default=10_000)
+    args = parser.parse_args()
+
+    print(f"memory: {_time_checks(MemoryLimiter(), args.n, args.keys) * 1e6:.2f} us/check")
+    with tempfile.TemporaryDirectory() as tmp:
+        limiter = SQLiteLimiter(Path(tmp) / "limits.db")
+        n = max(1, args.n // 20)
+        print(f"sqlite: {_time_checks(limiter, n, args.keys) * 1e6:.2f} us/check")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Date, section and cluster filters for /api/search.
+
+Each filter resolves to a sorted array of article rows from structures built
+once per index (articles sorted by date, rows grouped by section code and by
+cluster, in row order), and the arrays are intersected smallest first.
+Search then scores only the surviving rows, so a selective filter makes a
+query cheaper instead of post-filtering a large k.
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from cluster_index import MISSING_TS, parse_pub_dates
+from vector_index import cluster_lists
+
+
+def section_codes(values) -> tuple:
+    """Dictionary-encode section names: ``(codes, names)``, code -1 for missing."""
+    import pandas as pd
+
+    codes, names = pd.factorize(pd.Series(list(values), dtype=object), sort=True)
+    return codes.astype(np.int32), [str(name) for name in names]
+
+
+def parse_date_param(value: str, end: bool = False) -> int:
+    """Epoch seconds for an ISO date or datetime; a bare ``end`` date covers its whole day."""
+    ts = int(parse_pub_dates([value])[0])
+    if ts == MISSING_TS:
+        raise ValueError(f"Invalid date: {value!r}")
+    if end and len(value.strip()) == 10:
+        ts += 86399
+    return ts
+
+
+class SearchFilters:
+    def __init__(
+        self,
+        pub_ts: np.ndarray,
+        date_order: np.ndarray,
+        codes: np.ndarray,
+        names: List[str],
+        coarse_ids: np.ndarray,
+        fine_ids: np.ndarray,
+    ):
+        self.date_order = np.asarray(date_order)
+        self.sorted_ts = np.asarray(pub_ts)[self.date_order]
+        self.first_dated = int(np.searchsorted(self.sorted_ts, MISSING_TS, side="right"))
+        # Position of each row in date order, so a date range is a rank range.
+        self.date_rank = np.empty(len(self.date_order), dtype=np.int64)
+        self.date_rank[self.date_order] = np.arange(len(self.date_order))
+        # Bucket 0 holds articles without a section; code c lives in bucket c + 1.
+        self.section_order, self.section_offsets = cluster_lists(
+            np.asarray(codes) + 1, len(names) + 1
+        )
+        # Matching ignores case; names that differ only in case share a key.
+        self.section_lookup: Dict[str, List[int]] = {}
+        for code, name in enumerate(names):
+            self.section_lookup.setdefault(name.lower(), []).append(code)
+        # Member rows per cluster in row order (stable argsort), built once.
+        self.coarse_lists = self._row_lists(coarse_ids)
+        self.fine_lists = self._row_lists(fine_ids)
+
+    @staticmethod
+    def _row_lists(assignments: np.ndarray):
+        assignments = np.asarray(assignments)
+        n_lists = int(assignments.max()) + 1 if len(assignments) else 0
+        return cluster_lists(assignments, n_lists)
+
+    @classmethod
+    def from_index(cls, index: dict, articles, pub_ts):
+        """Use the index's precomputed arrays, deriving them for older indexes."""
+        date_order = index.get("date_order")
+        if date_order is None:
+            date_order = np.argsort(pub_ts, kind="stable")
+        codes = index.get("section_codes")
+        names = index.get("manifest", {}).get("section_names")
+        if codes is None or names is None:
+            codes, names = section_codes(articles[i]["section"] for i in range(len(articles)))
+        return cls(pub_ts, date_order, codes, names, index["coarse_ids"], index["fine_ids"])
+
+    @staticmethod
+    def _cluster_rows(lists, cid: int) -> np.ndarray:
+        order, offsets = lists
+        if not 0 <= cid < len(offsets) - 1:
+            return np.empty(0, dtype=np.int64)
+        return order[offsets[cid] : offsets[cid + 1]]
+
+    def _date_rows(self, lo: int, hi: int) -> np.ndarray:
+        """Sorted rows ranked ``lo <= rank < hi`` in date order."""
+        m = hi - lo
+        if m * max(np.log2(m), 1) < len(self.date_rank):
+            return np.sort(self.date_order[lo:hi])
+        return np.flatnonzero((self.date_rank >= lo) & (self.date_rank < hi))
+
+    def rows(
+        self,
+        date_from: Optional[int] = None,
+        date_to: Optional[int] = None,
+        section: Optional[str] = None,
+        coarse_id: Optional[int] = None,
+        fine_id: Optional[int] = None,
+    ) -> Optional[np.ndarray]:
+        """Sorted rows passing every given filter, or None when none is set.
+
+        Section and cluster filters are row-sorted lists intersected smallest
+        first. A date range is applied to their result by date rank, so it is
+        only materialized when it is the sole filter.
+        """
+        date_range = None
+        if date_from is not None or date_to is not None:
+            lo = self.first_dated
+            if date_from is not None:
+                lo = max(lo, int(np.searchsorted(self.sorted_ts, date_from, side="left")))
+            hi = len(self.sorted_ts)
+            if date_to is not None:
+                hi = int(np.searchsorted(self.sorted_ts, date_to, side="right"))
+            date_range = (lo, max(lo, hi))
+        sets = []
+        if section is not None:
+            buckets = [
+                self.section_order[self.section_offsets[code + 1] : self.section_offsets[code + 2]]
+                for code in self.section_lookup.get(section.strip().lower(), ())
+            ]
+            if len(buckets) == 1:
+                sets.append(buckets[0])
+            else:
+                sets.append(np.sort(np.concatenate(buckets or [np.empty(0, dtype=np.int64)])))
+        if coarse_id is not None:
+            sets.append(self._cluster_rows(self.coarse_lists, coarse_id))
+        if fine_id is not None:
+            sets.append(self._cluster_rows(self.fine_lists, fine_id))
+        if not sets:
+            return None if date_range is None else self._date_rows(*date_range)
+        sets.sort(key=len)
+        rows = np.asarray(sets[0], dtype=np.int64)
+        for other in sets[1:]:
+            if not len(rows):
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        if date_range is not None and len(rows):
+            rank = self.date_rank[rows]
+            rows = rows[(rank >= date_range[0]) & (rank < date_range[1])]
+        return rows
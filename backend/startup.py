@@ -0,0 +1,100 @@
+"""Background startup phases for the API.
+
+The server binds and answers ``/healthz`` right away while loaders run on
+daemon threads. Each loader wraps its work in ``phases.phase(name)``, which
+records how long it took (printed as it finishes) or the error that stopped
+it. Endpoints declare which phases they need; ``/readyz`` reports all of them.
+"""
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional
+
+
+class StartupPhases:
+    def __init__(self, names: Iterable[str]):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._status: Dict[str, str] = {name: "pending" for name in names}
+        self._seconds: Dict[str, float] = {}
+        self._errors: Dict[str, str] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        with self._lock:
+            self._status[name] = "loading"
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as exc:
+            with self._lock:
+                self._status[name] = "failed"
+                self._errors[name] = f"{type(exc).__name__}: {exc}"
+            print(f"[startup] {name} failed after {time.perf_counter() - start:.2f}s")
+            traceback.print_exc()
+            raise
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._status[name] = "ready"
+            self._seconds[name] = elapsed
+        print(
+            f"[startup] {name}: {elapsed:.2f}s "
+            f"({time.perf_counter() - self.started:.2f}s since startup began)"
+        )
+
+    def run(self, target: Callable[[], None], phases: Iterable[str]) -> threading.Thread:
+        """Run a loader for ``phases`` on a daemon thread.
+
+        An exception escaping the loader, whether from inside a phase or
+        between phases, marks every phase it had not finished as failed, so
+        /readyz reports the error instead of waiting forever.
+        """
+        phases = tuple(phases)
+
+        def guarded():
+            try:
+                target()
+            except Exception as exc:
+                self._fail_unfinished(phases, exc)
+
+        thread = threading.Thread(target=guarded, name=f"startup-{phases[0]}", daemon=True)
+        thread.start()
+        return thread
+
+    def _fail_unfinished(self, phases, exc: Exception):
+        error = f"{type(exc).__name__}: {exc}"
+        with self._lock:
+            # phase() has already logged errors raised inside a phase.
+            logged = any(self._errors.get(name) == error for name in phases)
+            unfinished = [n for n in phases if self._status[n] in ("pending", "loading")]
+            for name in unfinished:
+                self._status[name] = "failed"
+                self._errors.setdefault(name, error)
+        if not logged:
+            print(f"[startup] loader failed ({', '.join(unfinished)} not loaded)")
+            traceback.print_exception(type(exc), exc, exc.__traceback__)
+
+    def ready(self, *names: str) -> bool:
+        names = names or tuple(self._status)
+        with self._lock:
+            return all(self._status[name] == "ready" for name in names)
+
+    def failed(self) -> bool:
+        with self._lock:
+            return bool(self._errors)
+
+    def pending(self, *names: str) -> Optional[str]:
+        """The first of ``names`` that is not ready yet, if any."""
+        with self._lock:
+            return next((n for n in names if self._status[n] != "ready"), None)
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "ready": all(status == "ready" for status in self._status.values()),
+                "uptime_seconds": round(time.perf_counter() - self.started, 3),
+                "phases": dict(self._status),
+                "errors": dict(self._errors),
+                "timings": {name: round(s, 3) for name, s in self._seconds.items()},
+            }
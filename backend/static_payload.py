@@ -0,0 +1,89 @@
+import gzip
+import hashlib
+import json
+from typing import Optional
+
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:  # optional: gzip alone is still a big win
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_json(payload) -> bytes:
+    """Compact JSON bytes for plain dict/list payloads, via orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def json_response(payload) -> Response:
+    return Response(content=dumps_json(payload), media_type="application/json")
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = params.strip()
+        if q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        accepted.add(coding)
+    return accepted
+
+
+class StaticPayload:
+    """A JSON body serialized and compressed once, served with ETag revalidation.
+
+    Each encoding gets its own strong ETag (the raw body's digest plus the
+    coding name), so caches never mix up compressed and plain variants.
+    """
+
+    def __init__(self, body: bytes, cache_control: str):
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.cache_control = cache_control
+        self.bodies = {"identity": body, "gzip": gzip.compress(body, compresslevel=9)}
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(body, quality=11)
+        self.etags = {
+            coding: f'"{digest}"' if coding == "identity" else f'"{digest}-{coding}"'
+            for coding in self.bodies
+        }
+
+    def _not_modified(self, if_none_match: Optional[str], coding: str) -> bool:
+        """Only the negotiated variant's ETag validates a cached copy."""
+        if not if_none_match:
+            return False
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or self.etags[coding] in tags
+
+    def _pick_encoding(self, accept_encoding: str) -> str:
+        accepted = _accepted_encodings(accept_encoding)
+        for coding in ("br", "gzip"):
+            if coding in self.bodies and (coding in accepted or "*" in accepted):
+                return coding
+        return "identity"
+
+    def response(self, request: Request) -> Response:
+        coding = self._pick_encoding(request.headers.get("accept-encoding", ""))
+        headers = {
+            "ETag": self.etags[coding],
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if self._not_modified(request.headers.get("if-none-match"), coding):
+            return Response(status_code=304, headers=headers)
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+        return Response(
+            content=self.bodies[coding], media_type="application/json", headers=headers
+        )
@@ -0,0 +1,201 @@
+"""Add new articles to the current index without re-running build_index.py.
+
+Only the new rows are embedded. They are assigned to the existing coarse and
+fine clusters by nearest centroid and placed on the map between their nearest
+already-placed neighbors, so existing positions and cluster ids never move.
+Labels are kept; run ``python labels.py`` afterwards if clusters grew a lot.
+
+    python update_index.py new_articles.csv [--update-centroids]
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from build_index import summarize_clusters
+from cluster_index import parse_pub_dates
+from config import EMBEDDING_MODEL_NAME, LAYOUT_EXACT_MAX, UPDATE_NPROBE
+from data_prep import prepare_articles
+from embedding_cache import EmbeddingCache
+from embedding_model import load_embedding_model, model_fingerprint
+from index_store import load_index, write_index
+from layout import place_by_search
+from vector_index import QuantizedEmbeddings, VectorIndex, cluster_sums, normalize_rows
+
+
+def _cluster_state(index: dict, level: str):
+    """``(centroids, member sums)``, recomputed for indexes that predate either."""
+    centroids = index.get(f"{level}_centroids")
+    sums = index.get(f"{level}_sums")
+    if sums is None:
+        assignments = np.asarray(index[f"{level}_ids"])
+        if centroids is not None:
+            n_clusters = centroids.shape[0]
+        else:
+            n_clusters = max(len(index[f"{level}_clusters"]), int(assignments.max()) + 1)
+        sums = cluster_sums(index["embeddings"], assignments, n_clusters)
+    sums = np.array(sums, dtype=np.float32)
+    centroids = normalize_rows(sums) if centroids is None else np.asarray(centroids)
+    return centroids, sums
+
+
+def _updated_centroids(centroids, sums):
+    """Centroids as the normalized mean of all members, like a k-means update step."""
+    # Clusters that are still empty keep their old centroid.
+    return np.where(sums.any(axis=1, keepdims=True), normalize_rows(sums), centroids)
+
+
+def update_index(
+    new_articles: pd.DataFrame, update_centroids: bool = False, neighbors: int = 10
+):
+    """Append ``new_articles`` (already passed through ``prepare_articles``)."""
+    index = load_index()
+    old_table = index["articles"]
+    old_ids = np.asarray(old_table.ids)
+    new_articles = new_articles[~new_articles["id"].isin(old_ids)]
+    new_articles = new_articles.drop_duplicates(subset="id")
+    if new_articles.empty:
+        print("No new articles to add.")
+        return None
+
+    manifest = index.get("manifest", {})
+    model_name = manifest.get("embedding_model") or EMBEDDING_MODEL_NAME
+    if model_name != EMBEDDING_MODEL_NAME:
+        raise ValueError(
+            f"Index was embedded with {model_name}, config uses {EMBEDDING_MODEL_NAME}; "
+            "run build_index.py instead."
+        )
+    fingerprint = manifest.get("embedding_fingerprint")
+    if fingerprint is None:
+        print(
+            "Index does not record its embedding backend; assuming it matches "
+            f"{model_fingerprint()}."
+        )
+    elif fingerprint != model_fingerprint():
+        raise ValueError(
+            f"Index was embedded as {fingerprint}, config gives {model_fingerprint()} "
+            "(EMBEDDING_BACKEND / EMBEDDING_MAX_SEQ_LENGTH); mixing them would put "
+            "vectors from different encoders in one index. Run build_index.py instead."
+        )
+
+    print(f"Embedding {len(new_articles)} new articles...")
+    model = load_embedding_model()
+    new_emb = normalize_rows(
+        EmbeddingCache(model_fingerprint()).encode(
+            model, new_articles["text"].tolist(), normalize_embeddings=True
+        )
+    )
+
+    print("Assigning to existing clusters...")
+    coarse_centroids, coarse_sums = _cluster_state(index, "coarse")
+    fine_centroids, fine_sums = _cluster_state(index, "fine")
+    # Built before the centroids move, so the lists match the stored fine_ids.
+    neighbor_index = VectorIndex(
+        index["embeddings"],
+        index["fine_ids"],
+        fine_centroids,
+        nprobe=UPDATE_NPROBE,
+        min_size=LAYOUT_EXACT_MAX,
+        quantized=(
+            QuantizedEmbeddings(index["embedding_codes"], index["embedding_scales"])
+            if index.get("embedding_codes") is not None
+            else None
+        ),
+    )
+    new_coarse = np.argmax(new_emb @ coarse_centroids.T, axis=1).astype(np.int32)
+    fine_sims = new_emb @ fine_centroids.T
+    parents = np.asarray(index["parent_fine_ids"])
+    nested = np.array_equal(parents[index["fine_ids"]], index["coarse_ids"])
+    if nested:
+        # Nested clustering: stay inside the fine clusters of the chosen coarse one.
+        fine_sims[parents[None, :] != new_coarse[:, None]] = -np.inf
+    new_fine = np.argmax(fine_sims, axis=1).astype(np.int32)
+    # Sums always track the members, so a later --update-centroids is exact.
+    np.add.at(coarse_sums, new_coarse, new_emb)
+    np.add.at(fine_sums, new_fine, new_emb)
+    if update_centroids:
+        coarse_centroids = _updated_centroids(coarse_centroids, coarse_sums)
+        fine_centroids = _updated_centroids(fine_centroids, fine_sums)
+
+    print("Placing new articles on the map...")
+    new_coords = place_by_search(neighbor_index, index["coords_2d"], new_emb, k=neighbors)
+
+    embeddings = np.concatenate([index["embeddings"], new_emb])
+    coords = np.concatenate([index["coords_2d"], new_coords]).astype(np.float32)
+    coarse_ids = np.concatenate([index["coarse_ids"], new_coarse]).astype(np.int32)
+    fine_ids = np.concatenate([index["fine_ids"], new_fine]).astype(np.int32)
+
+    coarse_labels = index["coarse_cluster_labels"]
+    fine_labels = index["fine_cluster_labels"]
+    coarse_clusters, fine_clusters, parent_fine_ids, map_bounds = summarize_clusters(
+        coords,
+        coarse_ids,
+        fine_ids,
+        coarse_labels,
+        fine_labels,
+        coarse_centroids.shape[0],
+        fine_centroids.shape[0],
+        parent_fine_ids=parents if nested else None,
+    )
+
+    articles = pd.concat(
+        [pd.DataFrame(old_table.take(np.arange(len(old_table)))), new_articles],
+        ignore_index=True,
+    )
+    updated = {
+        "embeddings": embeddings,
+        "coords_2d": coords,
+        "coarse_ids": coarse_ids,
+        "fine_ids": fine_ids,
+        "parent_fine_ids": parent_fine_ids,
+        "coarse_centroids": coarse_centroids,
+        "fine_centroids": fine_centroids,
+        "coarse_sums": coarse_sums,
+        "fine_sums": fine_sums,
+        "coarse_clusters": coarse_clusters,
+        "fine_clusters": fine_clusters,
+        "coarse_cluster_labels": coarse_labels,
+        "fine_cluster_labels": fine_labels,
+        "map_bounds": map_bounds,
+    }
+    if index.get("lexical") is not None:
+        updated["lexical"] = index["lexical"].extend(new_articles["text"])
+    if index.get("pub_ts") is not None:
+        updated["pub_ts"] = np.concatenate(
+            [index["pub_ts"], parse_pub_dates(new_articles["pub_date"])]
+        )
+    out_path = write_index(
+        updated,
+        articles,
+        model_name=EMBEDDING_MODEL_NAME,
+        model_fingerprint=fingerprint or model_fingerprint(),
+    )
+    print(f"Added {len(new_articles)} articles; saved index to {out_path}")
+    return out_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add new articles to the current index.")
+    parser.add_argument("csv", help="NYT-style metadata CSV with the new articles")
+    parser.add_argument(
+        "--update-centroids",
+        action="store_true",
+        help="move the cluster centroids to the mean of all their members, new ones included",
+    )
+    parser.add_argument("--neighbors", type=int, default=10)
+    args = parser.parse_args()
+
+    raw = pd.read_csv(args.csv)
+    has_ids = "id" in raw.columns
+    new_articles = prepare_articles(raw)
+    if not has_ids:
+        # prepare_articles numbers rows from 0; continue after the existing ids.
+        start = int(np.max(load_index()["articles"].ids)) + 1
+        new_articles["id"] = np.arange(start, start + len(new_articles))
+    update_index(
+        new_articles, update_centroids=args.update_centroids, neighbors=args.neighbors
+    )
+
+
+if __name__ == "__main__":
+    main()
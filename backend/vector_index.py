@@ -0,0 +1,361 @@
+import argparse
+import time
+from typing import List, Optional
+
+import numpy as np
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length, leaving all-zero rows untouched."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, without sorting everything."""
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= n:
+        return np.argsort(-scores, kind="stable")
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Row-wise ``top_k`` for a (queries x candidates) score matrix."""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k] if k < scores.shape[1] else None
+    if part is None:
+        part = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+
+def cluster_lists(assignments: np.ndarray, n_lists: int):
+    """Group row ids by cluster: rows of cluster c are order[offsets[c]:offsets[c + 1]]."""
+    assignments = np.asarray(assignments)
+    order = np.argsort(assignments, kind="stable")
+    counts = np.bincount(assignments, minlength=n_lists)[:n_lists]
+    offsets = np.zeros(n_lists + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return order, offsets
+
+
+def cluster_sums(
+    embeddings: np.ndarray, assignments: np.ndarray, n_lists: int, chunk_size: int = 65536
+):
+    """Sum of member vectors per cluster; new members can be added to it later."""
+    sums = np.zeros((n_lists, embeddings.shape[1]), dtype=np.float32)
+    for start in range(0, embeddings.shape[0], chunk_size):
+        block = np.asarray(embeddings[start : start + chunk_size], dtype=np.float32)
+        np.add.at(sums, np.asarray(assignments[start : start + chunk_size]), block)
+    return sums
+
+
+def cluster_centroids(embeddings: np.ndarray, assignments: np.ndarray, n_lists: int):
+    """Normalized mean vector per cluster (used when an index predates stored centroids)."""
+    return normalize_rows(cluster_sums(embeddings, assignments, n_lists))
+
+
+def quantize(embeddings: np.ndarray, kind: str = "int8", chunk_size: int = 65536):
+    """Compact copy of normalized embeddings for the first search pass.
+
+    Returns ``(codes, scales)`` with ``codes * scales ~= embeddings``. int8 uses
+    a symmetric scale per dimension (its largest absolute value / 127);
+    float16 is a plain cast with unit scales.
+    """
+    n, dim = embeddings.shape
+    if kind == "float16":
+        return np.asarray(embeddings, dtype=np.float16), np.ones(dim, dtype=np.float32)
+    if kind != "int8":
+        raise ValueError(f"Unknown quantization: {kind}")
+    scales = np.zeros(dim, dtype=np.float32)
+    for start in range(0, n, chunk_size):
+        block = np.abs(np.asarray(embeddings[start : start + chunk_size]))
+        np.maximum(scales, block.max(axis=0), out=scales)
+    scales /= 127
+    scales[scales == 0] = 1.0
+    codes = np.empty((n, dim), dtype=np.int8)
+    for start in range(0, n, chunk_size):
+        block = np.asarray(embeddings[start : start + chunk_size], dtype=np.float32)
+        codes[start : start + chunk_size] = np.clip(np.rint(block / scales), -127, 127)
+    return codes, scales
+
+
+class QuantizedEmbeddings:
+    """Approximate dot products against int8 or float16 codes.
+
+    Codes are widened to float32 a block at a time, so scoring never holds
+    more than ``chunk_size`` full-precision rows.
+    """
+
+    def __init__(self, codes: np.ndarray, scales: np.ndarray, chunk_size: int = 16384):
+        self.codes = codes
+        self.scales = np.asarray(scales, dtype=np.float32)
+        self.chunk_size = chunk_size
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes)
+
+    def scores(self, q_vec: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        q = np.asarray(q_vec, dtype=np.float32) * self.scales
+        codes = self.codes if rows is None else self.codes[rows]
+        out = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], self.chunk_size):
+            block = codes[start : start + self.chunk_size]
+            out[start : start + block.shape[0]] = block.astype(np.float32) @ q
+        return out
+
+
+class VectorIndex:
+    """Cosine search over normalized embeddings with an optional IVF shortcut.
+
+    The fine clusters from ``build_index.py`` double as inverted lists: a query
+    is compared to every fine centroid first and only the ``nprobe`` closest
+    clusters are scored. ``nprobe=0`` falls back to a full scan, as does the
+    default ``nprobe`` on a corpus smaller than ``min_size``; an explicit
+    ``nprobe`` is always honored.
+
+    With ``quantized`` codes, candidates are scored against the compact copy
+    first and only the best ``k * rerank`` are re-scored from the float32
+    embeddings, which can then stay memory-mapped and mostly on disk.
+    ``exact=True`` skips both shortcuts and scores every candidate in float32.
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        list_ids: np.ndarray,
+        centroids: np.ndarray,
+        nprobe: int = 16,
+        min_size: int = 0,
+        quantized: Optional[QuantizedEmbeddings] = None,
+        rerank: int = 4,
+    ):
+        self.embeddings = embeddings
+        self.quantized = quantized
+        self.rerank = rerank
+        self.centroids = normalize_rows(centroids)
+        self.order, self.offsets = cluster_lists(list_ids, self.centroids.shape[0])
+        self.nprobe = nprobe
+        self.min_size = min_size
+
+    @property
+    def size(self) -> int:
+        return int(self.embeddings.shape[0])
+
+    def _resolve_nprobe(self, nprobe: Optional[int]) -> int:
+        if nprobe is not None:
+            return nprobe
+        return self.nprobe if self.size >= self.min_size else 0
+
+    def _use_exact(self, nprobe: int) -> bool:
+        return nprobe <= 0 or nprobe >= self.centroids.shape[0]
+
+    def probe(self, q_vec: np.ndarray, nprobe: int) -> np.ndarray:
+        """Row ids belonging to the ``nprobe`` fine clusters closest to the query."""
+        lists = top_k(self.centroids @ q_vec, nprobe)
+        return np.concatenate(
+            [self.order[self.offsets[c] : self.offsets[c + 1]] for c in lists]
+        )
+
+    def search_exact(self, q_vec: np.ndarray, k: int):
+        """Full-precision scan over every article (the recall baseline)."""
+        sims = self.embeddings @ q_vec
+        best = top_k(sims, k)
+        return best, sims[best]
+
+    def _rank(
+        self, q_vec: np.ndarray, k: int, rows: Optional[np.ndarray] = None, exact: bool = False
+    ):
+        if self.quantized is None or exact:
+            if rows is None:
+                return self.search_exact(q_vec, k)
+            sims = self.embeddings[rows] @ q_vec
+            best = top_k(sims, k)
+            return rows[best], sims[best]
+        shortlist = top_k(self.quantized.scores(q_vec, rows), k * self.rerank)
+        # Sorted ids keep the float32 reads in file order.
+        candidates = np.sort(shortlist if rows is None else rows[shortlist])
+        sims = np.asarray(self.embeddings[candidates]) @ q_vec
+        best = top_k(sims, k)
+        return candidates[best], sims[best]
+
+    def search_within(self, q_vec: np.ndarray, rows: np.ndarray, k: int, exact: bool = False):
+        """Best k of the given article rows, as ``(indices, scores)``."""
+        return self._rank(q_vec, k, np.asarray(rows, dtype=np.int64), exact=exact)
+
+    def _scan_batch(
+        self, queries: np.ndarray, k: int, block_size: int = 16384, exact: bool = False
+    ):
+        """Full scan for many queries at once: one (Q x D) @ (D x block) matmul
+        per block of articles, keeping each query's best candidates per block."""
+        quantized = None if exact else self.quantized
+        pool = k if quantized is None else k * self.rerank
+        q_mat = queries if quantized is None else queries * quantized.scales
+        cand_ids, cand_scores = [], []
+        for start in range(0, self.size, block_size):
+            if quantized is None:
+                block = np.asarray(self.embeddings[start : start + block_size])
+            else:
+                block = quantized.codes[start : start + block_size].astype(np.float32)
+            sims = q_mat @ block.T
+            best = top_k_rows(sims, pool)
+            cand_ids.append(best + start)
+            cand_scores.append(np.take_along_axis(sims, best, axis=1))
+        ids = np.concatenate(cand_ids, axis=1)
+        scores = np.concatenate(cand_scores, axis=1)
+        best = top_k_rows(scores, pool)
+        ids = np.take_along_axis(ids, best, axis=1)
+        if quantized is None:
+            scores = np.take_along_axis(scores, best, axis=1)
+            return list(zip(ids, scores))
+        results = []
+        for q_vec, shortlist in zip(queries, ids):
+            candidates = np.sort(shortlist)
+            sims = np.asarray(self.embeddings[candidates]) @ q_vec
+            top = top_k(sims, k)
+            results.append((candidates[top], sims[top]))
+        return results
+
+    def search_batch(
+        self,
+        queries: np.ndarray,
+        ks: List[int],
+        nprobe: Optional[int] = None,
+        exact: bool = False,
+    ):
+        """``search`` for a (Q x D) query matrix; returns one ``(indices, scores)`` per row."""
+        nprobe = self._resolve_nprobe(nprobe)
+        queries = np.asarray(queries, dtype=np.float32)
+        if not len(queries):
+            return []
+        if not exact and not self._use_exact(nprobe):
+            # Each query probes different lists, so IVF stays per query.
+            return [self.search(q, k, nprobe=nprobe) for q, k in zip(queries, ks)]
+        results = self._scan_batch(queries, max(ks), exact=exact)
+        return [(idx[:k], scores[:k]) for (idx, scores), k in zip(results, ks)]
+
+    def search(
+        self,
+        q_vec: np.ndarray,
+        k: int,
+        nprobe: Optional[int] = None,
+        rows: Optional[np.ndarray] = None,
+        exact: bool = False,
+    ):
+        """Return ``(indices, scores)`` of the k most similar articles, best first.
+
+        ``rows`` (sorted) restricts the search to those articles. Sets smaller
+        than a typical probe are scored directly; larger ones are intersected
+        with the probed lists. ``exact`` scores every article (or every row) in
+        float32, matching ``search_exact``.
+        """
+        if exact:
+            return self._rank(q_vec, k, rows, exact=True)
+        nprobe = self._resolve_nprobe(nprobe)
+        if rows is not None:
+            probe_size = self.size * nprobe / self.centroids.shape[0]
+            if not self._use_exact(nprobe) and len(rows) > probe_size:
+                candidates = np.intersect1d(self.probe(q_vec, nprobe), rows, assume_unique=True)
+                if candidates.size >= k:
+                    return self._rank(q_vec, k, candidates)
+            return self._rank(q_vec, k, rows)
+        if self._use_exact(nprobe):
+            return self._rank(q_vec, k)
+        candidates = self.probe(q_vec, nprobe)
+        if candidates.size < k:
+            return self._rank(q_vec, k)
+        return self._rank(q_vec, k, candidates)
+
+
+def recall_report(
+    index: VectorIndex, queries: np.ndarray, k: int, nprobes: List[int]
+) -> List[dict]:
+    """Compare search to the float32 exact scan: mean recall@k and latency per
+    nprobe (0 = scan everything, through the quantized pass if configured)."""
+    start = time.perf_counter()
+    truth = [set(index.search_exact(q, k)[0].tolist()) for q in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    rows = [{"nprobe": None, "recall": 1.0, "ms_per_query": exact_ms}]
+    for nprobe in nprobes:
+        start = time.perf_counter()
+        found = [index.search(q, k, nprobe=nprobe)[0] for q in queries]
+        elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        recall = np.mean(
+            [len(truth[i].intersection(f.tolist())) / k for i, f in enumerate(found)]
+        )
+        rows.append({"nprobe": nprobe, "recall": float(recall), "ms_per_query": elapsed_ms})
+    return rows
+
+
+def main():
+    from index_store import load_index
+
+    parser = argparse.ArgumentParser(
+        description="Recall vs latency of IVF and quantized search."
+    )
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--queries-file", help="one query per line, encoded with the model")
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[0, 1, 2, 4, 8, 16, 32])
+    parser.add_argument(
+        "--quantize",
+        choices=["int8", "float16"],
+        help="also test this quantization (default: the codes stored in the index, if any)",
+    )
+    parser.add_argument("--rerank", type=int, default=4, help="re-ranked candidates per result")
+    args = parser.parse_args()
+
+    index = load_index()
+    embeddings = index["embeddings"]
+    centroids = index.get("fine_centroids")
+    if centroids is None:
+        centroids = cluster_centroids(
+            embeddings, index["fine_ids"], index["parent_fine_ids"].shape[0]
+        )
+    variants = [("float32", None)]
+    codes, scales = index.get("embedding_codes"), index.get("embedding_scales")
+    if args.quantize:
+        codes, scales = quantize(embeddings, args.quantize)
+    if codes is not None:
+        variants.append(
+            (f"{codes.dtype} + rerank x{args.rerank}", QuantizedEmbeddings(codes, scales))
+        )
+    vindex = VectorIndex(embeddings, index["fine_ids"], centroids)
+
+    if args.queries_file:
+        from sentence_transformers import SentenceTransformer
+
+        from config import EMBEDDING_MODEL_NAME
+
+        with open(args.queries_file, encoding="utf-8") as fh:
+            texts = [line.strip() for line in fh if line.strip()]
+        model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        queries = model.encode(texts, normalize_embeddings=True)
+    else:
+        # Article vectors stand in for queries; real query text is usually
+        # further from any centroid, so treat these recalls as an upper bound.
+        rng = np.random.default_rng(0)
+        picks = rng.choice(vindex.size, size=min(args.queries, vindex.size), replace=False)
+        queries = embeddings[picks]
+
+    print(f"{vindex.size} articles, {len(queries)} queries, k={args.k}")
+    for name, quantized in variants:
+        vindex.quantized, vindex.rerank = quantized, args.rerank
+        nbytes = embeddings.nbytes if quantized is None else quantized.nbytes
+        print(f"\n{name}: {nbytes / 2**20:.1f} MiB scanned per full pass")
+        print(f"{'nprobe':>8} {'recall@k':>10} {'ms/query':>10}")
+        for row in recall_report(vindex, queries, args.k, args.nprobe):
+            label = {None: "exact", 0: "scan"}.get(row["nprobe"], str(row["nprobe"]))
+            print(f"{label:>8} {row['recall']:>10.3f} {row['ms_per_query']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()